@@ -0,0 +1,363 @@
+"""
+Cola de trabajos persistente (SQLite) + daemon local para convertir bibliotecas enteras.
+
+- Cada trabajo es una carpeta de serie con su perfil, preset y opciones de plan.
+- El daemon reclama trabajos por prioridad con un "lease" renovable: varios procesos
+  (o máquinas que comparten el sistema de archivos) pueden vaciar la misma cola, y un
+  trabajo cuyo worker muere vuelve a estar disponible al caducar su lease.
+- Reintentos con espera creciente; estado consultable por HTTP en 127.0.0.1.
+
+Uso:
+    py -3.13 jobqueue.py add "D:\\Manga\\Berserk" --profile TMO --priority 5
+    py -3.13 jobqueue.py daemon --jobs 2 --port 8765
+    py -3.13 jobqueue.py status
+"""
+from __future__ import annotations
+
+import os
+import sys
+import json
+import time
+import socket
+import signal
+import sqlite3
+import argparse
+import threading
+import dataclasses
+from pathlib import Path
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import main as kmo
+
+
+DEFAULT_DB = "jobs.sqlite3"
+LEASE_S = 300               # un trabajo sin latido durante este tiempo se considera huérfano
+POLL_S = 2.0                # espera del daemon cuando la cola está vacía
+RETRY_BACKOFF_S = 60        # espera antes del reintento n: n * RETRY_BACKOFF_S
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id            INTEGER PRIMARY KEY AUTOINCREMENT,
+    folder        TEXT NOT NULL,
+    profile       TEXT NOT NULL,
+    settings      TEXT NOT NULL,          -- PipelineSettings (JSON)
+    plan          TEXT NOT NULL,          -- subcarpetas, tamaño de grupo, volumen inicial (JSON)
+    options       TEXT NOT NULL,          -- RunOptions (JSON)
+    priority      INTEGER NOT NULL DEFAULT 0,
+    status        TEXT NOT NULL DEFAULT 'queued',   -- queued | running | done | failed
+    attempts      INTEGER NOT NULL DEFAULT 0,
+    max_attempts  INTEGER NOT NULL DEFAULT 3,
+    not_before    REAL NOT NULL DEFAULT 0,
+    worker        TEXT,
+    lease_until   REAL,
+    created_at    REAL NOT NULL,
+    started_at    REAL,
+    finished_at   REAL,
+    volumes       TEXT,                   -- volúmenes completados (JSON)
+    error         TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_pick ON jobs (status, priority DESC, id);
+"""
+
+
+class JobQueue:
+    """Acceso a la cola. Cada operación abre su propia conexión, así que una instancia
+    puede usarse desde varios hilos; la exclusión entre procesos la da SQLite
+    (BEGIN IMMEDIATE). En carpetas de red el bloqueo depende del sistema de archivos:
+    SMB/NFS con locks funcionales."""
+
+    def __init__(self, db_path: Path | str = DEFAULT_DB):
+        self.db_path = Path(db_path)
+        with self._connect() as db:
+            db.executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        db.row_factory = sqlite3.Row
+        db.execute("PRAGMA busy_timeout = 30000")
+        return db
+
+    def add(self, folder: Path, profile: str = "INMANGA",
+            settings: kmo.PipelineSettings | None = None, options: kmo.RunOptions | None = None,
+            subfolders: bool = True, group_size: int = 10, start_volume: int = 1,
+            priority: int = 0, max_attempts: int = 3) -> int:
+        folder = Path(folder).resolve()
+        settings = settings or kmo.PipelineSettings()
+        options = options or kmo.RunOptions(series=folder.name)
+        plan = {"subfolders": subfolders, "group_size": group_size, "start_volume": start_volume}
+        with self._connect() as db:
+            cur = db.execute(
+                "INSERT INTO jobs (folder, profile, settings, plan, options, priority, max_attempts, created_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (str(folder), profile, json.dumps(dataclasses.asdict(settings)), json.dumps(plan),
+                 json.dumps(dataclasses.asdict(options)), priority, max_attempts, time.time()))
+            return cur.lastrowid
+
+    def claim(self, worker: str, lease_s: float = LEASE_S) -> sqlite3.Row | None:
+        """Reclama el trabajo disponible de mayor prioridad (o uno huérfano) de forma atómica,
+        saltando las series que ya se están convirtiendo.
+        Un huérfano que ya agotó sus intentos (p. ej. tumba al daemon en cada intento)
+        pasa a 'failed' en lugar de reintentarse sin fin."""
+        now = time.time()
+        with self._connect() as db:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                db.execute(
+                    "UPDATE jobs SET status = 'failed', finished_at = ?, lease_until = NULL,"
+                    " error = COALESCE(error, 'el worker murió en el último intento')"
+                    " WHERE status = 'running' AND lease_until < ? AND attempts >= max_attempts", (now, now))
+                # una serie por vez: los trabajos de la misma serie comparten --out/<serie>
+                # (temp/, vol_NN, informe) y se pisarían entre sí
+                row = db.execute(
+                    "SELECT * FROM jobs WHERE ((status = 'queued' AND not_before <= ?)"
+                    " OR (status = 'running' AND lease_until < ?))"
+                    " AND json_extract(options, '$.series') NOT IN"
+                    " (SELECT json_extract(options, '$.series') FROM jobs"
+                    "  WHERE status = 'running' AND lease_until >= ?)"
+                    " ORDER BY priority DESC, id LIMIT 1", (now, now, now)).fetchone()
+                if row is None:
+                    db.execute("COMMIT")
+                    return None
+                db.execute(
+                    "UPDATE jobs SET status = 'running', worker = ?, lease_until = ?, started_at = ?,"
+                    " attempts = attempts + 1, error = NULL WHERE id = ?",
+                    (worker, now + lease_s, now, row["id"]))
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            return db.execute("SELECT * FROM jobs WHERE id = ?", (row["id"],)).fetchone()
+
+    def heartbeat(self, job_id: int, worker: str, lease_s: float = LEASE_S) -> bool:
+        """Renueva el lease; False si el trabajo ya no pertenece a este worker."""
+        with self._connect() as db:
+            cur = db.execute("UPDATE jobs SET lease_until = ? WHERE id = ? AND worker = ? AND status = 'running'",
+                             (time.time() + lease_s, job_id, worker))
+            return cur.rowcount == 1
+
+    def finish(self, job_id: int, worker: str, ok: bool, volumes: list[int], error: str | None = None):
+        with self._connect() as db:
+            row = db.execute("SELECT attempts, max_attempts FROM jobs WHERE id = ? AND worker = ?",
+                             (job_id, worker)).fetchone()
+            if row is None:
+                return      # el lease caducó y otro worker se lo quedó
+            if ok:
+                status, not_before = "done", 0
+            elif row["attempts"] < row["max_attempts"]:
+                status, not_before = "queued", time.time() + row["attempts"] * RETRY_BACKOFF_S
+            else:
+                status, not_before = "failed", 0
+            db.execute("UPDATE jobs SET status = ?, not_before = ?, finished_at = ?, volumes = ?, error = ?,"
+                       " lease_until = NULL WHERE id = ?",
+                       (status, not_before, time.time(), json.dumps(volumes), error, job_id))
+
+    def release(self, job_id: int, worker: str):
+        """Devuelve a la cola un trabajo interrumpido por el apagado del daemon (sin gastar intento)."""
+        with self._connect() as db:
+            db.execute("UPDATE jobs SET status = 'queued', attempts = attempts - 1, lease_until = NULL"
+                       " WHERE id = ? AND worker = ? AND status = 'running'", (job_id, worker))
+
+    def status(self) -> dict:
+        with self._connect() as db:
+            counts = {r["status"]: r["n"] for r in
+                      db.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status")}
+            jobs = [dict(r) for r in db.execute(
+                "SELECT id, folder, profile, priority, status, attempts, max_attempts, worker,"
+                " started_at, finished_at, volumes, error FROM jobs ORDER BY id")]
+        return {"counts": counts, "jobs": jobs}
+
+
+# -------------------------- Daemon --------------------------
+class Daemon:
+    """Vacía la cola con `jobs` conversiones en paralelo (una serie por hilo; cada
+    conversión usa a su vez su pool de procesos de páginas)."""
+
+    def __init__(self, queue: JobQueue, out_root: Path, jobs: int = 1, base_path: Path | None = None):
+        self.queue = queue
+        self.out_root = Path(out_root)
+        self.jobs = max(1, jobs)
+        self.base_path = base_path or Path.cwd()
+        self.stop_event = threading.Event()
+        self.running: dict[int, str] = {}      # job id -> worker (para /status)
+        self._lock = threading.Lock()
+
+    def log(self, message: str):
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] {message}", flush=True)
+
+    def serve_forever(self):
+        threads = [threading.Thread(target=self._worker_loop, args=(i,), daemon=True) for i in range(self.jobs)]
+        for t in threads:
+            t.start()
+        self.log(f"Daemon activo: {self.jobs} trabajo(s) en paralelo, cola {self.queue.db_path}")
+        while any(t.is_alive() for t in threads):
+            for t in threads:
+                t.join(timeout=0.5)
+
+    def _worker_loop(self, index: int):
+        worker = f"{socket.gethostname()}:{os.getpid()}:{index}"
+        while not self.stop_event.is_set():
+            job = self.queue.claim(worker)
+            if job is None:
+                self.stop_event.wait(POLL_S)
+                continue
+            with self._lock:
+                self.running[job["id"]] = worker
+            try:
+                self._run_job(job, worker)
+            finally:
+                with self._lock:
+                    self.running.pop(job["id"], None)
+
+    def _run_job(self, job, worker: str):
+        job_id = job["id"]
+        folder = Path(job["folder"])
+        settings = kmo.PipelineSettings(**json.loads(job["settings"]))
+        options = kmo.RunOptions(**json.loads(job["options"]))
+        plan_opts = json.loads(job["plan"])
+        self.log(f"#{job_id} ▶ {folder.name} (intento {job['attempts']}/{job['max_attempts']}, {worker})")
+
+        cancel_event = threading.Event()
+        beat_stop = threading.Event()
+
+        def heartbeat():
+            # renueva el lease; si lo perdemos (otro worker lo reclamó) o el daemon
+            # se apaga, cancela la conversión
+            next_beat = time.monotonic() + LEASE_S / 3
+            while not beat_stop.wait(1.0):
+                if self.stop_event.is_set():
+                    cancel_event.set()
+                if time.monotonic() >= next_beat:
+                    next_beat = time.monotonic() + LEASE_S / 3
+                    if not self.queue.heartbeat(job_id, worker):
+                        cancel_event.set()
+
+        threading.Thread(target=heartbeat, daemon=True).start()
+        try:
+            if not folder.is_dir():
+                raise FileNotFoundError(f"No existe la carpeta: {folder}")
+            chapters = kmo.scan_chapters(folder, kmo.PROFILES[job["profile"]], plan_opts["subfolders"])
+            plan = kmo.plan_volumes(chapters, plan_opts["group_size"])
+            if not plan:
+                raise ValueError("No hay capítulos")
+            # un reintento vuelve a convertir el plan entero: los volúmenes que ya salieron
+            # bien se sobrescriben en vez de duplicarse con fecha (también en trabajos ya encolados)
+            options = dataclasses.replace(options, start_volume=plan_opts["start_volume"], replace_existing=True)
+            work_dir = self.out_root / options.series
+            converter = kmo.Converter(self.base_path, settings, options, cancel_event=cancel_event,
+                                      log=lambda m: self.log(f"#{job_id} {m}"), work_dir=work_dir)
+            completed = converter.run(plan)
+            if self.stop_event.is_set():
+                self.queue.release(job_id, worker)
+                self.log(f"#{job_id} devuelto a la cola (apagado)")
+                return
+            ok = len(completed) == len(plan)
+            self.queue.finish(job_id, worker, ok, completed,
+                              None if ok else f"{len(plan) - len(completed)} volumen(es) fallidos")
+            self.log(f"#{job_id} {'✅' if ok else '❌'} {folder.name}: {len(completed)}/{len(plan)} volúmenes")
+        except Exception as e:
+            self.queue.finish(job_id, worker, False, [], str(e))
+            self.log(f"#{job_id} ❌ {e}")
+        finally:
+            beat_stop.set()
+
+
+def serve_status(daemon: Daemon, port: int) -> ThreadingHTTPServer:
+    """GET /status (o /) -> JSON con recuentos, trabajos y los que corren en este daemon."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.rstrip("/") not in ("", "/status"):
+                self.send_error(404)
+                return
+            data = daemon.queue.status()
+            with daemon._lock:
+                data["running_here"] = dict(daemon.running)
+            body = json.dumps(data, ensure_ascii=False, indent=1).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass    # sin ruido en la consola del daemon
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# -------------------------- CLI --------------------------
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Cola de conversión de Kindle Manga Optimizer")
+    parser.add_argument("--db", default=DEFAULT_DB, help="base de datos SQLite de la cola")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    add = sub.add_parser("add", help="encolar una carpeta de serie")
+    add.add_argument("folder")
+    add.add_argument("--profile", choices=list(kmo.PROFILES.keys()), default="INMANGA")
+    add.add_argument("--no-subfolders", action="store_true")
+    add.add_argument("--preset", default=kmo.PipelineSettings.preset)
+    add.add_argument("--device", choices=list(kmo.DEVICES.keys()) + ["libre"], default=kmo.PipelineSettings.device)
+    add.add_argument("--devices", default="", help="fan-out: claves separadas por comas (un MOBI por dispositivo)")
+    add.add_argument("--writer", choices=["kcc", "azw3"], default=kmo.RunOptions.writer,
+                     help="empaquetado: KCC + kindlegen (MOBI) o escritor KF8 nativo (AZW3)")
+    add.add_argument("--quality", type=int, default=kmo.PipelineSettings.jpg_quality)
+    add.add_argument("--group-size", type=int, default=10)
+    add.add_argument("--start-volume", type=int, default=1)
+    add.add_argument("--series", default="")
+    add.add_argument("--author", default="")
+    add.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) - 1),
+                     help="procesos de páginas por trabajo")
+    add.add_argument("--kp3-dir", default="")
+    add.add_argument("--priority", type=int, default=0, help="mayor = antes")
+    add.add_argument("--max-attempts", type=int, default=3)
+
+    daemon = sub.add_parser("daemon", help="procesar la cola")
+    daemon.add_argument("--jobs", type=int, default=1, help="series en paralelo")
+    daemon.add_argument("--out", default="biblioteca", help="carpeta raíz de salida (una subcarpeta por serie)")
+    daemon.add_argument("--port", type=int, default=8765, help="puerto HTTP de estado (0 = sin HTTP)")
+
+    sub.add_parser("status", help="mostrar el estado de la cola")
+    args = parser.parse_args(argv)
+
+    queue = JobQueue(args.db)
+    if args.cmd == "add":
+        folder = Path(args.folder)
+        try:
+            devices = kmo.parse_devices(args.devices)
+        except ValueError as e:
+            print(f"--devices: {e}")
+            return 1
+        settings = kmo.PipelineSettings(preset=args.preset, jpg_quality=args.quality,
+                                        device=devices[0] if devices else ("" if args.device == "libre" else args.device))
+        options = kmo.RunOptions(series=args.series.strip() or folder.name, author=args.author,
+                                 workers=max(1, args.workers), kp3_dir=args.kp3_dir,
+                                 clean_temp_before=True, clean_ebooks_before=False, replace_existing=True,
+                                 devices=devices if len(devices) > 1 else (), writer=args.writer)
+        job_id = queue.add(folder, args.profile, settings, options, subfolders=not args.no_subfolders,
+                           group_size=args.group_size, start_volume=args.start_volume,
+                           priority=args.priority, max_attempts=args.max_attempts)
+        print(f"Trabajo #{job_id} encolado: {folder}")
+        return 0
+
+    if args.cmd == "status":
+        data = queue.status()
+        print("  ".join(f"{k}={v}" for k, v in sorted(data["counts"].items())) or "cola vacía")
+        for j in data["jobs"]:
+            print(f"#{j['id']:>4} {j['status']:<8} p={j['priority']:<3} {j['attempts']}/{j['max_attempts']}"
+                  f"  {j['folder']}" + (f"  ({j['error']})" if j["error"] else ""))
+        return 0
+
+    d = Daemon(queue, Path(args.out), jobs=args.jobs)
+    signal.signal(signal.SIGINT, lambda *_: d.stop_event.set())    # Ctrl+C: terminar y devolver trabajos
+    if args.port:
+        serve_status(d, args.port)
+        d.log(f"Estado en http://127.0.0.1:{args.port}/status")
+    d.serve_forever()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,409 @@
+"""
+Escritor KF8 (AZW3) de maquetación fija para volúmenes de sólo imágenes.
+
+- Empaqueta las páginas JPG ya procesadas (una página XHTML por imagen) sin KCC ni
+  kindlegen: funciona igual en Linux, macOS y Windows y no tiene el techo de un
+  proceso de un solo hilo por volumen.
+- Contenedor KF8 puro (versión 8): registro 0 con cabeceras PalmDOC/MOBI/EXTH, texto
+  sin comprimir, índices SKEL/FRAG/NCX, FDST, FLIS, FCIS y EOF. Metadatos: título,
+  autor, serie y volumen, idioma, maquetación fija con la resolución del panel y
+  lectura derecha→izquierda (manga).
+- Las imágenes se copian tal cual desde disco al archivo (streaming): el tamaño de
+  cada registro sale de stat() y nunca se cargan todas en memoria.
+- Sin dependencias: sólo la biblioteca estándar (el tamaño de cada JPG se lee de su
+  marcador SOF).
+
+Uso (prueba local sobre la salida del pipeline, p. ej. temp/vol_01):
+    py -3.13 kf8.py temp/vol_01 "Serie - v01.azw3" --title "Serie - v01" --author "Autor" --series "Serie" --volume 1
+"""
+from __future__ import annotations
+
+import re
+import sys
+import time
+import uuid
+import shutil
+import struct
+import argparse
+from pathlib import Path
+from datetime import datetime, timezone
+from dataclasses import dataclass
+from html import escape
+
+
+TEXT_RECORD_SIZE = 4096
+NULL = 0xFFFFFFFF
+INDEX_HEADER_LENGTH = 192
+INDEX_RECORD_LIMIT = 0x10000 - INDEX_HEADER_LENGTH - 1048   # margen de kindlegen
+CNCX_RECORD_LIMIT = 0x10000 - 1024
+CNCX_MAX_STRING = 500
+BASE32 = "0123456789ABCDEFGHIJKLMNOPQRSTUV"
+# identificadores de idioma de la cabecera MOBI (LANGID primario de Windows)
+LANGUAGE_CODES = {"en": 0x09, "es": 0x0A, "fr": 0x0C, "de": 0x07, "it": 0x10, "ja": 0x11, "pt": 0x16}
+
+FLIS = (b"FLIS\0\0\0\x08\0\x41\0\0\0\0\0\0\xff\xff\xff\xff\0\x01\0\x03\0\0\0\x03\0\0\0\x01"
+        + b"\xff" * 4)
+EOF = b"\xe9\x8e\r\n"
+
+
+@dataclass(frozen=True)
+class BookMeta:
+    title: str
+    author: str = ""
+    series: str = ""
+    volume: int | None = None
+    language: str = "en"
+    rtl: bool = True            # manga: lectura derecha→izquierda
+
+
+# -------------------------- Utilidades binarias --------------------------
+def _encint(value: int) -> bytes:
+    """Entero de longitud variable de los índices KF8 (7 bits por byte, el último marcado)."""
+    out = bytearray()
+    while True:
+        out.append(value & 0x7F)
+        value >>= 7
+        if not value:
+            break
+    out[0] |= 0x80
+    out.reverse()
+    return bytes(out)
+
+
+def _align(raw: bytes) -> bytes:
+    return raw + b"\0" * (-len(raw) % 4)
+
+
+def _base32(n: int, digits: int = 1) -> str:
+    out = ""
+    while n:
+        n, r = divmod(n, 32)
+        out = BASE32[r] + out
+    return out.rjust(digits, "0")
+
+
+def _read_exact(f, n: int, path: Path) -> bytes:
+    data = f.read(n)
+    if len(data) < n:
+        raise ValueError(f"{path.name}: JPEG truncado")
+    return data
+
+
+def jpeg_size(path: Path) -> tuple[int, int]:
+    """(ancho, alto) leyendo los marcadores hasta el SOF, sin decodificar la imagen.
+    ValueError si no es un JPEG o está truncado antes del SOF."""
+    with open(path, "rb") as f:
+        if f.read(2) != b"\xff\xd8":
+            raise ValueError(f"{path.name}: no es un JPEG")
+        while True:
+            marker = f.read(2)
+            if len(marker) < 2 or marker[0] != 0xFF:
+                raise ValueError(f"{path.name}: JPEG sin marcador SOF")
+            if marker[1] in (0xD8, 0x01) or 0xD0 <= marker[1] <= 0xD7:
+                continue
+            length = struct.unpack(">H", _read_exact(f, 2, path))[0]
+            if 0xC0 <= marker[1] <= 0xCF and marker[1] not in (0xC4, 0xC8, 0xCC):
+                h, w = struct.unpack(">xHH", _read_exact(f, 5, path))
+                return w, h
+            f.seek(length - 2, 1)
+
+
+# -------------------------- Índices (SKEL, FRAG, NCX) --------------------------
+# bits de la máscara -> desplazamiento del número de valores en el byte de control
+_MASK_SHIFT = {1: 0, 2: 1, 3: 0, 4: 2, 8: 3, 12: 2, 16: 4, 32: 5, 48: 4, 64: 6, 128: 7, 192: 6}
+
+
+class _Cncx:
+    """Tabla de cadenas de un índice: longitud (encint) + UTF-8, en registros < 64 KB."""
+
+    def __init__(self, strings):
+        self.offsets: dict[str, int] = {}
+        self.records: list[bytes] = []
+        buf = bytearray()
+        for s in dict.fromkeys(strings):
+            utf8 = s[:CNCX_MAX_STRING].encode("utf-8")
+            raw = _encint(len(utf8)) + utf8
+            if len(buf) + len(raw) > CNCX_RECORD_LIMIT:
+                self.records.append(_align(bytes(buf)))
+                buf = bytearray()
+            self.offsets[s] = len(self.records) * 0x10000 + len(buf)
+            buf += raw
+        if buf:
+            self.records.append(_align(bytes(buf)))
+
+
+def _index_records(tags: tuple, entries: list[tuple[bytes, dict]], cncx: _Cncx | None = None) -> list[bytes]:
+    """Registros de un índice INDX: cabecera (TAGX + geometría) + registros de entradas
+    + registros CNCX. `tags`: (nombre, número, valores por entrada, máscara)."""
+    tagx_body = b"".join(bytes((num, vpe, mask, 0)) for _, num, vpe, mask in tags) + bytes((0, 0, 0, 1))
+    tagx = b"TAGX" + struct.pack(">II", 12 + len(tagx_body), 1) + tagx_body
+
+    blocks = [(bytearray(), [], [b""])]     # (entradas, offsets IDXT, [última clave])
+    for ident, values in entries:
+        control = 0
+        body = bytearray()
+        for name, _, vpe, mask in tags:
+            vals = values.get(name, ())
+            if vals:
+                control |= mask & ((len(vals) // vpe) << _MASK_SHIFT[mask])
+                for v in vals:
+                    body += _encint(v)
+        raw = bytes((len(ident),)) + ident + bytes((control,)) + body
+        data, offsets, last = blocks[-1]
+        if len(data) + 2 * len(offsets) + len(raw) + 2 > INDEX_RECORD_LIMIT:
+            blocks.append((bytearray(), [], [b""]))
+            data, offsets, last = blocks[-1]
+        offsets.append(INDEX_HEADER_LENGTH + len(data))
+        data += raw
+        last[0] = ident
+
+    records = []
+    for data, offsets, _ in blocks:
+        data = _align(bytes(data))
+        idxt = _align(b"IDXT" + b"".join(struct.pack(">H", o) for o in offsets))
+        header = (b"INDX" + struct.pack(">IIIIII", INDEX_HEADER_LENGTH, 0, 1, 0,
+                                        INDEX_HEADER_LENGTH + len(data), len(offsets))
+                  + b"\xff" * 8 + bytes(156))
+        records.append(header + data + idxt)
+
+    # la geometría de los registros (última clave y número de entradas de cada uno)
+    # va en la cabecera como entradas apuntadas por su propio IDXT
+    geometry = bytearray()
+    geo_offsets = []
+    base = INDEX_HEADER_LENGTH + len(tagx)
+    for _, offsets, last in blocks:
+        geo_offsets.append(base + len(geometry))
+        geometry += bytes((len(last[0]),)) + last[0] + struct.pack(">H", len(offsets))
+    geometry = _align(bytes(geometry))
+    idxt = _align(b"IDXT" + b"".join(struct.pack(">H", o) for o in geo_offsets))
+    ncncx = len(cncx.records) if cncx else 0
+    header = (b"INDX" + struct.pack(">I", INDEX_HEADER_LENGTH) + bytes(8)
+              + struct.pack(">IIIIII", 2, base + len(geometry), len(records), 65001, NULL,
+                            sum(len(o) for _, o, _ in blocks))
+              + bytes(12) + struct.pack(">I", ncncx) + bytes(124)
+              + struct.pack(">I", INDEX_HEADER_LENGTH) + bytes(8))
+    return [header + tagx + geometry + idxt] + records + (cncx.records if cncx else [])
+
+
+SKEL_TAGS = (("chunk_count", 1, 1, 3), ("geometry", 6, 2, 12))
+CHUNK_TAGS = (("cncx_offset", 2, 1, 1), ("file_number", 3, 1, 2), ("sequence_number", 4, 1, 4),
+              ("geometry", 6, 2, 8))
+NCX_TAGS = (("offset", 1, 1, 1), ("length", 2, 1, 2), ("label", 3, 1, 4), ("depth", 4, 1, 8),
+            ("pos_fid", 6, 2, 128))
+
+
+# -------------------------- Texto (una página XHTML por imagen) --------------------------
+def _page_parts(n: int, size: tuple[int, int], viewport: tuple[int, int], title: str) -> tuple[bytes, bytes]:
+    """(esqueleto, fragmento) de la página n. El fragmento (la imagen) se inserta justo
+    después de <body>; los aid son únicos en todo el libro."""
+    vw, vh = viewport
+    s = min(vw / size[0], vh / size[1])
+    w, h = max(1, round(size[0] * s)), max(1, round(size[1] * s))
+    body_aid, div_aid, img_aid = (_base32(3 * n + k) for k in range(3))
+    skeleton = (
+        '<?xml version="1.0" encoding="UTF-8"?>\n<!DOCTYPE html>\n'
+        '<html xmlns="http://www.w3.org/1999/xhtml"><head>'
+        f"<title>{escape(title)}</title>"
+        f'<meta name="viewport" content="width={vw}, height={vh}"/>'
+        '<style type="text/css">body{margin:0;padding:0}</style>'
+        f'</head><body aid="{body_aid}"></body></html>'
+    )
+    chunk = (
+        f'<div aid="{div_aid}" style="position:absolute;left:0;top:0;width:{vw}px;height:{vh}px">'
+        f'<img aid="{img_aid}" src="kindle:embed:{_base32(n + 1, 4)}?mime=image/jpeg" alt="" '
+        f'width="{w}" height="{h}" style="position:absolute;left:{(vw - w) // 2}px;top:{(vh - h) // 2}px"/>'
+        "</div>"
+    )
+    # ASCII puro: ningún carácter queda partido entre registros de texto de 4 KB
+    return (skeleton.encode("ascii", "xmlcharrefreplace"), chunk.encode("ascii", "xmlcharrefreplace"))
+
+
+def _build_text(sizes: list[tuple[int, int]], viewport: tuple[int, int], title: str):
+    """Texto del flujo 0 (esqueleto + fragmento por página) y tablas SKEL/FRAG.
+    Devuelve (texto, entradas SKEL, entradas FRAG, cncx FRAG, inicio de cada fragmento)."""
+    text = bytearray()
+    skel_entries, chunk_entries, chunk_starts = [], [], []
+    selectors = []
+    for n, size in enumerate(sizes):
+        skeleton, chunk = _page_parts(n, size, viewport, title)
+        start = len(text)
+        insert = start + skeleton.index(b"</body>")
+        selector = f"P-//*[@aid='{_base32(3 * n)}']"
+        selectors.append(selector)
+        skel_entries.append((f"SKEL{n:010d}".encode(), {"chunk_count": (1, 1),
+                                                         "geometry": (start, len(skeleton)) * 2}))
+        chunk_entries.append((f"{insert:010d}".encode(), {"file_number": (n,), "sequence_number": (n,),
+                                                           "geometry": (0, len(chunk)), "selector": selector}))
+        text += skeleton
+        chunk_starts.append(len(text))
+        text += chunk
+    cncx = _Cncx(selectors)
+    for _, values in chunk_entries:
+        values["cncx_offset"] = (cncx.offsets[values.pop("selector")],)
+    return bytes(text), skel_entries, chunk_entries, cncx, chunk_starts
+
+
+def _ncx(toc: list[tuple[str, int]], chunk_starts: list[int], text_length: int):
+    """Índice NCX plano: una entrada por capítulo, apuntando al fragmento de su primera página."""
+    toc = [(label, page) for label, page in toc if 0 <= page < len(chunk_starts)]
+    cncx = _Cncx(label for label, _ in toc)
+    entries = []
+    for k, (label, page) in enumerate(toc):
+        offset = chunk_starts[page]
+        end = chunk_starts[toc[k + 1][1]] if k + 1 < len(toc) else text_length
+        entries.append((f"{k:02x}".encode(), {"offset": (offset,), "length": (max(0, end - offset),),
+                                              "label": (cncx.offsets[label],), "depth": (0,),
+                                              "pos_fid": (page, 0)}))
+    return entries, cncx
+
+
+# -------------------------- Registro 0 --------------------------
+def _exth(meta: BookMeta, viewport: tuple[int, int], n_images: int, uid: str) -> bytes:
+    def s(v: str) -> bytes:
+        return v.encode("utf-8")
+
+    def u32(v: int) -> bytes:
+        return struct.pack(">I", v)
+
+    items = [(503, s(meta.title)), (501, b"EBOK"), (524, s(meta.language)),
+             (113, s(uid)), (504, s(uid)),
+             (106, s(datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S+00:00"))),
+             (122, b"true"), (307, s(f"{viewport[0]}x{viewport[1]}")),
+             (525, b"horizontal-rl" if meta.rtl else b"horizontal-lr"),
+             (527, b"rtl" if meta.rtl else b"ltr"),
+             (125, u32(n_images)), (201, u32(0)),
+             (204, u32(201)), (205, u32(2)), (206, u32(9)), (207, u32(0))]
+    if meta.author:
+        items.append((100, s(meta.author)))
+    if meta.series:
+        desc = meta.series + (f", volumen {meta.volume}" if meta.volume is not None else "")
+        items.append((103, s(desc)))
+    body = b"".join(struct.pack(">II", t, len(v) + 8) + v for t, v in items)
+    pad = b"\0" * (4 - len(body) % 4)       # siempre al menos un byte
+    return b"EXTH" + struct.pack(">II", len(body) + 12, len(items)) + body + pad
+
+
+def _record0(meta: BookMeta, exth: bytes, text_length: int, n_text: int, idx: dict[str, int], uid: int) -> bytes:
+    title = meta.title.encode("utf-8")
+    palmdoc = struct.pack(">HHIHHHH", 1, 0, text_length, n_text, TEXT_RECORD_SIZE, 0, 0)
+    mobi = b"".join((
+        b"MOBI",
+        struct.pack(">IIIII", 264, 2, 65001, uid, 8),
+        struct.pack(">II", NULL, NULL) + struct.pack(">8I", *[NULL] * 8),
+        struct.pack(">III", idx["first_non_text"], 16 + 264 + len(exth), len(title)),
+        struct.pack(">IIII", LANGUAGE_CODES.get(meta.language, 0), 0, 0, 8),
+        struct.pack(">I", idx["first_resource"]),
+        bytes(16),                                  # Huffman
+        struct.pack(">I", 0x50),                    # hay EXTH
+        bytes(32),
+        struct.pack(">IIIII", NULL, NULL, 0, 0, 0),  # índice desconocido + DRM
+        bytes(8),
+        struct.pack(">IIIIII", idx["fdst"], 1, idx["fcis"], 1, idx["flis"], 1),
+        bytes(8),
+        struct.pack(">II", NULL, 0),                # SRCS
+        b"\xff" * 8,
+        struct.pack(">I", 1),                       # registros de texto con byte de solape
+        struct.pack(">IIIII", idx["ncx"], idx["chunk"], idx["skel"], NULL, NULL),
+        struct.pack(">IIII", NULL, 0, NULL, 0),
+    ))
+    return _align(palmdoc + mobi + exth + title + b"\0\0")
+
+
+def _fcis(text_length: int) -> bytes:
+    return (b"FCIS\x00\x00\x00\x14\x00\x00\x00\x10\x00\x00\x00\x02\x00\x00\x00\x00"
+            + struct.pack(">I", text_length)
+            + b"\x00\x00\x00\x00\x00\x00\x00\x28\x00\x00\x00\x00\x00\x00\x00"
+            + b"\x28\x00\x00\x00\x08\x00\x01\x00\x01\x00\x00\x00\x00")
+
+
+# -------------------------- Escritura --------------------------
+def write_azw3(pages: list[Path], out: Path, meta: BookMeta, toc: list[tuple[str, int]] = (),
+               viewport: tuple[int, int] | None = None) -> Path:
+    """Escribe `pages` (JPG, en orden; la primera es la portada) como AZW3 de maquetación
+    fija. `toc`: (título, índice de página) por capítulo. `viewport`: resolución del
+    panel; por defecto la de la página más grande. Escribe en `out`.part y renombra."""
+    if not pages:
+        raise ValueError("no hay páginas")
+    sizes = [jpeg_size(p) for p in pages]
+    viewport = viewport or max(sizes, key=lambda s: s[0] * s[1])
+    text, skel_entries, chunk_entries, chunk_cncx, chunk_starts = _build_text(sizes, viewport, meta.title)
+
+    text_records = [text[i:i + TEXT_RECORD_SIZE] + b"\0"     # + byte de solape multibyte (0)
+                    for i in range(0, len(text), TEXT_RECORD_SIZE)]
+    pre = text_records
+    if sum(map(len, text_records)) % 4:
+        pre = pre + [b"\0" * (4 - sum(map(len, text_records)) % 4)]
+    idx = {"first_non_text": len(text_records) + 1, "first_resource": 1 + len(pre)}
+    after = []
+    for name, records in (("chunk", _index_records(CHUNK_TAGS, chunk_entries, chunk_cncx)),
+                          ("skel", _index_records(SKEL_TAGS, skel_entries)),
+                          ("ncx", _index_records(NCX_TAGS, *_ncx(list(toc) or [(meta.title, 0)],
+                                                                 chunk_starts, len(text))))):
+        idx[name] = idx["first_resource"] + len(pages) + len(after)
+        after += records
+    for name, record in (("fdst", b"FDST" + struct.pack(">IIII", 12, 1, 0, len(text))),
+                         ("flis", FLIS), ("fcis", _fcis(len(text)))):
+        idx[name] = idx["first_resource"] + len(pages) + len(after)
+        after.append(record)
+    after.append(EOF)
+
+    uid = str(uuid.uuid4())
+    exth = _exth(meta, viewport, len(pages), uid)
+    record0 = _record0(meta, exth, len(text), len(text_records), idx, uuid.UUID(uid).int & 0xFFFFFFFF)
+
+    # tabla de registros: las imágenes sólo aportan su tamaño (se copian al final)
+    sizes_out = [len(record0)] + [len(r) for r in pre] + [p.stat().st_size for p in pages] + [len(r) for r in after]
+    n = len(sizes_out)
+    if n > 0xFFFF:
+        raise ValueError("demasiados registros para un solo archivo")
+    offset = 78 + 8 * n + 2
+    table = bytearray()
+    for i, size in enumerate(sizes_out):
+        table += struct.pack(">II", offset, 2 * i)
+        offset += size
+    now = int(time.time())
+    name = re.sub(r"[^-A-Za-z0-9]+", "_", meta.title).encode("ascii")[:31]
+    header = (name.ljust(32, b"\0") + struct.pack(">HHIIIIII", 0, 0, now, now, 0, 0, 0, 0)
+              + b"BOOKMOBI" + struct.pack(">IIH", 2 * n - 1, 0, n))
+
+    part = out.with_name(out.name + ".part")
+    try:
+        with open(part, "wb") as f:
+            f.write(header + table + b"\0\0")
+            f.write(record0)
+            for r in pre:
+                f.write(r)
+            for p in pages:
+                with open(p, "rb") as src:
+                    shutil.copyfileobj(src, f, 1 << 20)
+            for r in after:
+                f.write(r)
+        part.replace(out)
+    except BaseException:
+        part.unlink(missing_ok=True)
+        raise
+    return out
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Empaquetar una carpeta de JPG como AZW3 (KF8) de maquetación fija")
+    parser.add_argument("folder")
+    parser.add_argument("output")
+    parser.add_argument("--title", default="")
+    parser.add_argument("--author", default="")
+    parser.add_argument("--series", default="")
+    parser.add_argument("--volume", type=int, default=None)
+    parser.add_argument("--language", default="en")
+    parser.add_argument("--ltr", action="store_true", help="lectura izquierda→derecha (por defecto, manga)")
+    args = parser.parse_args(argv)
+    pages = sorted(Path(args.folder).glob("*.jpg"))
+    out = Path(args.output)
+    meta = BookMeta(title=args.title or out.stem, author=args.author, series=args.series,
+                    volume=args.volume, language=args.language, rtl=not args.ltr)
+    write_azw3(pages, out, meta)
+    print(f"{out}: {len(pages)} página(s), {out.stat().st_size / 2**20:.1f} MB")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
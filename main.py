@@ -2,30 +2,99 @@
 Kindle Manga Optimizer v5.0 (MOBI + Preview pro)
 - Presets legibles (manga limpio, antiguo, JPEG artifacts, texto B/N, sólo recorte)
 - Vista previa en vivo: Antes/Después y 2×2 comparativo
-- Pipeline pro: CLAHE, NLMeans, Unsharp sin halos, Sauvola/Niblack (ximgproc opcional)
+- Pipeline pro: CLAHE, NLMeans, Unsharp sin halos, Sauvola/Wolf propio (imágenes integrales, sin contrib)
 - Recorte automático de bordes + margen blanco; Dither E-Ink opcional
 - Export: nombres secuenciales de páginas (evita sobrescrituras)
 - JPEG 4:4:4 + progresivo (líneas finas más limpias)
 - KCC -> MOBI con metadatos; autodetección KCC y kindlegen (Kindle Previewer 3)
+- O AZW3 (KF8) nativo con kf8.py: sin KCC ni kindlegen
 - Volumen inicial configurable; nombre de salida: "Serie - vNN.mobi"
 """
+from __future__ import annotations
+
+import time
+_T0 = time.perf_counter()   # referencia del presupuesto de arranque (report_startup)
+
+import io
 import os
 import re
+import json
 import sys
+import argparse
+import importlib.util
 import shutil
+import tempfile
+import signal
+import functools
 import subprocess
 import threading
+import multiprocessing
 from pathlib import Path
 from datetime import datetime
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
+from collections import deque, OrderedDict
 import queue
 
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
 
-from PIL import Image, ImageEnhance, ImageOps, ImageTk, ImageDraw
-import numpy as np
-import cv2
+
+# -------------------------- Imports diferidos --------------------------
+# OpenCV, NumPy y PIL se cargan en el primer uso (procesar o vista previa), no al
+# arrancar. Los imports son explícitos para que PyInstaller los siga detectando.
+def _import_heavy(alias: str):
+    if alias == "cv2":
+        import cv2 as module
+    elif alias == "np":
+        import numpy as module
+    elif alias == "Image":
+        from PIL import Image as module
+    elif alias == "ImageTk":
+        from PIL import ImageTk as module
+    elif alias == "ImageDraw":
+        from PIL import ImageDraw as module
+    else:
+        raise ImportError(alias)
+    return module
+
+
+class _LazyModule:
+    """Proxy que importa el módulo real en el primer acceso a un atributo y se
+    sustituye a sí mismo en los globals: los accesos siguientes son directos."""
+
+    def __init__(self, alias: str):
+        self._alias = alias
+
+    def __getattr__(self, attr):
+        module = _import_heavy(self._alias)
+        globals()[self._alias] = module
+        return getattr(module, attr)
+
+
+cv2 = _LazyModule("cv2")
+np = _LazyModule("np")
+Image = _LazyModule("Image")
+ImageTk = _LazyModule("ImageTk")
+ImageDraw = _LazyModule("ImageDraw")
+
+
+@functools.lru_cache(maxsize=None)
+def missing_dependencies() -> tuple[str, ...]:
+    # find_spec localiza el paquete sin importarlo (no cuesta el import de cv2)
+    return tuple(name for name in ("cv2", "numpy", "PIL") if importlib.util.find_spec(name) is None)
+
+
+# -------------------------- Presupuesto de arranque --------------------------
+STARTUP_BUDGET_MS = {"gui": 1500, "headless": 400}
+
+
+def report_startup(path: str, log=print) -> bool:
+    """Registra el tiempo de arranque en frío frente a su presupuesto."""
+    elapsed = (time.perf_counter() - _T0) * 1000
+    budget = STARTUP_BUDGET_MS[path]
+    ok = elapsed <= budget
+    log(f"Arranque ({path}): {elapsed:.0f} ms / presupuesto {budget} ms" + ("" if ok else " ⚠ excedido"))
+    return ok
 
 
 # -------------------------- Modelos y Perfiles --------------------------
@@ -92,29 +161,1745 @@ PROFILES = {
 }
 
 
+# -------------------------- Dispositivos Kindle --------------------------
+@dataclass(frozen=True)
+class DeviceProfile:
+    key: str        # coincide con el --profile de KCC
+    label: str
+    width: int      # resolución exacta del panel
+    height: int
+
+
+DEVICES = {d.key: d for d in (
+    DeviceProfile("K810", "Kindle 8/10", 600, 800),
+    DeviceProfile("KPW", "Kindle Paperwhite 1/2", 758, 1024),
+    DeviceProfile("KV", "Kindle Paperwhite 3/4 / Voyage / Oasis", 1072, 1448),
+    DeviceProfile("K11", "Kindle 11", 1072, 1448),
+    DeviceProfile("KPW5", "Kindle Paperwhite 5 / Signature", 1236, 1648),
+    DeviceProfile("KO", "Kindle Oasis 2/3", 1264, 1680),
+    DeviceProfile("KS", "Kindle Scribe", 1860, 2480),
+)}
+LEGACY_KCC_PROFILE = "KPW"      # modo libre (sin dispositivo): KCC reescala a este perfil
+
+
+def parse_devices(text: str) -> tuple[str, ...]:
+    """"KPW, ko,KS" -> ("KPW", "KO", "KS") para el fan-out; ValueError si alguna no existe."""
+    keys = tuple(dict.fromkeys(k.strip().upper() for k in text.split(",") if k.strip()))
+    unknown = [k for k in keys if k not in DEVICES]
+    if unknown:
+        raise ValueError(f"dispositivo(s) desconocido(s): {', '.join(unknown)}")
+    return keys
+
+
+# -------------------------- Análisis de página --------------------------
+# Umbrales calibrados para el clasificador rápido (ver analyze_page)
+ANALYSIS_MAX_SIDE = 384     # lado máximo de la miniatura para histograma/color
+ANALYSIS_CROP = 256         # recorte central a resolución completa (ruido/bloques)
+NOISE_LOW = 2.0             # sigma estimada por debajo de la cual no hace falta denoise
+NOISE_HIGH = 6.0            # a partir de aquí se usa NLMeans completo
+BLOCKINESS_HIGH = 1.25      # ratio bordes 8x8 / interior que delata artefactos JPEG
+SPREAD_FULL = 190           # rango p2..p98 que ya aprovecha el histograma (CLAHE sobra)
+COLORFUL_MIN = 12.0         # Hasler–Süsstrunk; por debajo la página es gris a efectos prácticos
+
+
+@dataclass
+class PageStats:
+    noise: float
+    spread: int
+    blockiness: float
+    colorfulness: float
+
+    @property
+    def is_gray(self) -> bool:
+        return self.colorfulness < COLORFUL_MIN
+
+    @property
+    def needs_denoise(self) -> bool:
+        return self.noise >= NOISE_LOW or self.blockiness >= BLOCKINESS_HIGH
+
+    def describe(self) -> str:
+        return (f"ruido={self.noise:.1f} rango={self.spread} "
+                f"bloques={self.blockiness:.2f} color={self.colorfulness:.1f}")
+
+
+def _estimate_noise(gray: np.ndarray) -> float:
+    # Immerkær: la respuesta del kernel a ruido gaussiano sigma tiene std 6*sigma.
+    # Usamos la mediana (MAD) para que bordes y tramas no dominen la estimación.
+    kernel = np.array([[1, -2, 1], [-2, 4, -2], [1, -2, 1]], dtype=np.float32)
+    resp = cv2.filter2D(gray, cv2.CV_32F, kernel)[1:-1, 1:-1]
+    return float(1.4826 * np.median(np.abs(resp)) / 6.0)
+
+
+def _estimate_blockiness(gray: np.ndarray) -> float:
+    # Diferencias en las fronteras de la rejilla 8x8 frente al interior de los bloques
+    ratios = []
+    for diff in (np.abs(np.diff(gray, axis=1)), np.abs(np.diff(gray, axis=0)).T):
+        boundary = diff[:, 7::8]
+        inner_mask = np.ones(diff.shape[1], dtype=bool)
+        inner_mask[7::8] = False
+        inner = diff[:, inner_mask]
+        ratios.append((float(boundary.mean()) + 1.0) / (float(inner.mean()) + 1.0))
+    return sum(ratios) / len(ratios)
+
+
+def analyze_page(img: Image.Image) -> PageStats:
+    """Clasificador rápido: histograma y color sobre una miniatura; ruido y
+    bloques JPEG sobre un recorte central a resolución completa (la rejilla 8x8
+    no sobrevive al reescalado)."""
+    small = img.copy()
+    small.thumbnail((ANALYSIS_MAX_SIDE, ANALYSIS_MAX_SIDE), Image.Resampling.BILINEAR)
+    rgb = np.asarray(small.convert("RGB"), dtype=np.float32)
+    gray_small = rgb @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+    lo, hi = np.percentile(gray_small, (2, 98))
+    rg = rgb[..., 0] - rgb[..., 1]
+    yb = 0.5 * (rgb[..., 0] + rgb[..., 1]) - rgb[..., 2]
+    colorfulness = float(np.hypot(rg.std(), yb.std()) + 0.3 * np.hypot(rg.mean(), yb.mean()))
+
+    w, h = img.size
+    side = min(ANALYSIS_CROP, w, h) // 8 * 8
+    if side >= 16:
+        x0 = (w - side) // 2 // 8 * 8
+        y0 = (h - side) // 2 // 8 * 8
+        crop = np.asarray(img.crop((x0, y0, x0 + side, y0 + side)).convert("L"), dtype=np.float32)
+        noise = _estimate_noise(crop)
+        blockiness = _estimate_blockiness(crop)
+    else:
+        noise, blockiness = 0.0, 1.0
+
+    return PageStats(noise=noise, spread=int(hi - lo), blockiness=blockiness, colorfulness=colorfulness)
+
+
+# -------------------------- Pipeline de imagen --------------------------
+# Todo lo de esta sección es independiente de Tk: recibe un PipelineSettings
+# (instantánea inmutable de la UI) para poder ejecutarse en procesos worker.
+@dataclass(frozen=True)
+class PipelineSettings:
+    preset: str = "Manga limpio (rápido)"
+    target_width: int = 1200
+    jpg_quality: int = 84
+    contrast_boost: float = 1.15
+    sharpness_boost: float = 1.2
+    noise_reduction: bool = True
+    auto_contrast: bool = True
+    to_grayscale: bool = False
+    adaptive_threshold: bool = False
+    adaptive_ops: bool = True
+    eink_dither: bool = False
+    strip_mode: bool = False
+    ssim_target: float = 0.0     # >0: calidad JPEG por página (jpg_quality pasa a ser el máximo)
+    device: str = "KPW"          # clave de DEVICES; "" = modo libre (target_width + KCC reescala)
+    preview_scale: float = 1.0   # <1: vista previa proxy; radios, bloques y márgenes se escalan
+    binarizer: str = "sauvola"   # "sauvola" | "wolf" (preset Texto pequeño B/N)
+    denoise: str = "fast"        # "fast" (luminancia, ventana 5) | "bilateral" (clásico 9×9 por canal)
+    binarize_stats_scale: float = 1.0   # <1: media/desviación local sobre una reducción
+    blank_pages: str = "off"     # páginas uniformes: "off" | "minimal" (página precalculada) | "drop"
+                                 # (opt-in: la sonda no distingue una página casi vacía de una con poco dibujo)
+    reduced_decode: bool = False # JPEG decodificado ya reducido (draft) al tamaño de salida
+
+
+def _px(size: float, settings: PipelineSettings, odd: bool = False, minimum: int = 1) -> int:
+    """Tamaño en píxeles (ventana, bloque, margen) a la escala de trabajo."""
+    v = max(minimum, int(round(size * settings.preview_scale)))
+    return v | 1 if odd else v
+
+
+def _to_cv(img):
+    return cv2.cvtColor(np.array(img), cv2.COLOR_RGB2BGR)
+
+
+def _from_cv(mat):
+    return Image.fromarray(cv2.cvtColor(mat, cv2.COLOR_BGR2RGB))
+
+
+def _clahe_gray(img_cv, clip=2.0, tile=8):
+    gray = cv2.cvtColor(img_cv, cv2.COLOR_BGR2GRAY)
+    clahe = cv2.createCLAHE(clipLimit=clip, tileGridSize=(tile,tile))
+    g2 = clahe.apply(gray)
+    return cv2.cvtColor(g2, cv2.COLOR_GRAY2BGR)
+
+
+def _bilateral(img_cv, settings: PipelineSettings):
+    return cv2.bilateralFilter(img_cv, _px(9, settings, minimum=3), 75, 75 * settings.preview_scale)
+
+
+def _edge_denoise(img_cv, settings: PipelineSettings):
+    """Reducción de ruido básica que preserva bordes. En modo "fast" el bilateral
+    usa ventana 5 (≈6× menos coste que 9×9 y bordes algo más nítidos) y, en color,
+    sólo filtra la luminancia: el ruido de trama está en Y, el croma del JPEG ya
+    viene submuestreado. Acepta un canal o BGR."""
+    if settings.denoise == "bilateral":
+        return _bilateral(img_cv, settings)
+    d = _px(5, settings, minimum=3)
+    if img_cv.ndim == 2:
+        return cv2.bilateralFilter(img_cv, d, 75, 5 * settings.preview_scale)
+    ycc = cv2.cvtColor(img_cv, cv2.COLOR_BGR2YCrCb)
+    ycc[..., 0] = cv2.bilateralFilter(ycc[..., 0], d, 75, 5 * settings.preview_scale)
+    return cv2.cvtColor(ycc, cv2.COLOR_YCrCb2BGR)
+
+
+def _nl_means(img_cv, settings: PipelineSettings, strength=7):
+    try:
+        return cv2.fastNlMeansDenoisingColored(img_cv, None, strength, strength,
+                                               _px(7, settings, odd=True, minimum=3),
+                                               _px(21, settings, odd=True, minimum=7))
+    except Exception:
+        # fallback a bilateral si no está disponible
+        return _bilateral(img_cv, settings)
+
+
+def _nl_means_gray(img_cv, settings: PipelineSettings, strength=7):
+    # páginas sin color: un solo canal cuesta ~1/3 que la versión a color
+    gray = cv2.cvtColor(img_cv, cv2.COLOR_BGR2GRAY)
+    try:
+        gray = cv2.fastNlMeansDenoising(gray, None, strength, _px(7, settings, odd=True, minimum=3),
+                                        _px(21, settings, odd=True, minimum=7))
+    except Exception:
+        gray = _bilateral(gray, settings)
+    return cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR)
+
+
+BINARIZE_WINDOW = 35        # ventana de las estadísticas locales (px a resolución de trabajo)
+BINARIZE_K = 0.2
+SAUVOLA_R = 128.0           # rango dinámico de la desviación típica en 8 bits
+
+
+def _local_stats(gray, window: int, stats_scale: float = 1.0):
+    """Media y desviación típica locales con filtros de caja (sumas acumuladas:
+    coste lineal e independiente del tamaño de la ventana). Con stats_scale < 1
+    se calculan sobre una reducción y se interpolan a tamaño completo."""
+    h, w = gray.shape
+    src = gray
+    if stats_scale < 1.0:
+        src = cv2.resize(gray, (max(1, round(w * stats_scale)), max(1, round(h * stats_scale))),
+                         interpolation=cv2.INTER_AREA)
+        window = max(3, round(window * stats_scale)) | 1
+    src = src.astype(np.float32)
+    mean = cv2.boxFilter(src, cv2.CV_32F, (window, window), borderType=cv2.BORDER_REFLECT)
+    sq = cv2.sqrBoxFilter(src, cv2.CV_32F, (window, window), borderType=cv2.BORDER_REFLECT)
+    std = cv2.sqrt(cv2.max(sq - mean * mean, 0))
+    if src.shape != gray.shape:
+        mean = cv2.resize(mean, (w, h), interpolation=cv2.INTER_LINEAR)
+        std = cv2.resize(std, (w, h), interpolation=cv2.INTER_LINEAR)
+    return mean, std
+
+
+def binarize(gray, window: int = BINARIZE_WINDOW, k: float = BINARIZE_K,
+             method: str = "sauvola", stats_scale: float = 1.0):
+    """Binarización local de Sauvola (T = m·(1 + k·(s/R − 1))) o de Wolf–Jolion
+    (T = m − k·(1 − s/max s)·(m − min)) sobre un canal uint8. Sólo usa el núcleo de
+    OpenCV/NumPy, así que el resultado no depende de tener opencv-contrib."""
+    mean, std = _local_stats(gray, window, stats_scale)
+    # el umbral se construye en el búfer de std (operaciones en sitio, sin temporales)
+    if method == "wolf":
+        r = max(float(std.max()), 1e-6)
+        lo = float(gray.min())
+        mean -= lo                          # m − min
+        std *= k / r
+        std += 1.0 - k
+        std *= mean                         # (1 − k·(1 − s/R))·(m − min)
+        std += lo
+    else:
+        std *= k / SAUVOLA_R
+        std += 1.0 - k
+        std *= mean                         # m·(1 + k·(s/R − 1))
+    return cv2.compare(gray.astype(np.float32), std, cv2.CMP_GT)
+
+
+def _sauvola_like(img_cv, settings: PipelineSettings):
+    gray = cv2.cvtColor(img_cv, cv2.COLOR_BGR2GRAY)
+    bin_ = binarize(gray, _px(BINARIZE_WINDOW, settings, odd=True, minimum=3),
+                    method=settings.binarizer, stats_scale=settings.binarize_stats_scale)
+    return cv2.cvtColor(bin_, cv2.COLOR_GRAY2BGR)
+
+
+def _auto_trim_and_pad(img_cv, pad_px=16):
+    gray = cv2.cvtColor(img_cv, cv2.COLOR_BGR2GRAY)
+    thr = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV+cv2.THRESH_OTSU)[1]
+    contours, _ = cv2.findContours(thr, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if not contours:
+        return img_cv
+    x,y,w,h = cv2.boundingRect(np.vstack(contours))
+    cropped = img_cv[y:y+h, x:x+w]
+    h_, w_ = cropped.shape[:2]
+    canvas = np.full((h_ + 2*pad_px, w_ + 2*pad_px, 3), 255, dtype=np.uint8)
+    canvas[pad_px:pad_px+h_, pad_px:pad_px+w_] = cropped
+    return canvas
+
+
+TRIM_PROXY_SIDE = 600      # lado del proxy para localizar el contenido antes de reescalar
+PAGE_PAD = 16              # margen blanco alrededor del contenido
+
+
+def _content_bbox(img: Image.Image) -> tuple[int, int, int, int] | None:
+    """Caja del contenido (Otsu + contornos, como _auto_trim_and_pad) calculada
+    sobre un proxy reducido y devuelta en coordenadas de `img`."""
+    small = img.convert("L")
+    small.thumbnail((TRIM_PROXY_SIDE, TRIM_PROXY_SIDE), Image.Resampling.BILINEAR)
+    thr = cv2.threshold(np.asarray(small), 0, 255, cv2.THRESH_BINARY_INV+cv2.THRESH_OTSU)[1]
+    contours, _ = cv2.findContours(thr, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if not contours:
+        return None
+    x, y, w, h = cv2.boundingRect(np.vstack(contours))
+    sx, sy = img.width / small.width, img.height / small.height
+    return (max(0, int(x * sx) - 1), max(0, int(y * sy) - 1),
+            min(img.width, int((x + w) * sx) + 1), min(img.height, int((y + h) * sy) + 1))
+
+
+def _fit_to_device(img: Image.Image, device: DeviceProfile, trim: bool = True) -> Image.Image:
+    """Único remuestreo del modo dispositivo: recorta el contenido (sin remuestrear)
+    y lo escala para que quepa en el panel menos el margen."""
+    if trim:
+        bbox = _content_bbox(img)
+        if bbox:
+            img = img.crop(bbox)
+    size = _device_size(img.size, device)
+    if size != img.size:
+        img = img.resize(size, Image.Resampling.LANCZOS)
+    return img
+
+
+def _device_size(size: tuple[int, int], device: DeviceProfile) -> tuple[int, int]:
+    """Tamaño con el que un contenido de `size` cabe en el panel menos el margen."""
+    w, h = size
+    s = min((device.width - 2 * PAGE_PAD) / w, (device.height - 2 * PAGE_PAD) / h)
+    return max(1, round(w * s)), max(1, round(h * s))
+
+
+def _letterbox(img_cv, device: DeviceProfile):
+    """Centra la página sobre un lienzo blanco con la geometría exacta del panel."""
+    h, w = img_cv.shape[:2]
+    if w > device.width or h > device.height:
+        # sólo ocurre con imágenes que no pasaron por _fit_to_device (vista previa)
+        s = min(device.width / w, device.height / h)
+        img_cv = cv2.resize(img_cv, (max(1, int(w * s)), max(1, int(h * s))), interpolation=cv2.INTER_AREA)
+        h, w = img_cv.shape[:2]
+    canvas = np.full((device.height, device.width, 3), 255, dtype=np.uint8)
+    y, x = (device.height - h) // 2, (device.width - w) // 2
+    canvas[y:y+h, x:x+w] = img_cv
+    return canvas
+
+
+def _apply_eink_dither(pil_img_rgb):
+    return pil_img_rgb.convert("P", palette=Image.ADAPTIVE, colors=256, dither=Image.FLOYDSTEINBERG).convert("RGB")
+
+
+# ---------------- Operaciones puntuales (LUT) y nitidez en un núcleo ----------------
+def _autocontrast_lut(img_cv):
+    """Equivalente a ImageOps.autocontrast (cutoff=0) como LUT de cv2: estira por
+    canal el rango [mín, máx] a [0, 255]. Devuelve (256,) o (1, 256, C)."""
+    channels = 1 if img_cv.ndim == 2 else img_cv.shape[2]
+    luts = []
+    for c in range(channels):
+        hist = cv2.calcHist([img_cv], [c], None, [256], [0, 256]).ravel()
+        used = np.flatnonzero(hist)
+        lo, hi = (int(used[0]), int(used[-1])) if used.size else (0, 255)
+        if hi <= lo:
+            luts.append(np.arange(256, dtype=np.uint8))
+            continue
+        scale = 255.0 / (hi - lo)
+        luts.append(np.clip(np.arange(256) * scale - lo * scale, 0, 255).astype(np.uint8))
+    return luts[0] if channels == 1 else np.dstack(luts)
+
+
+def _contrast_lut(img_cv, factor: float):
+    """Equivalente a ImageEnhance.Contrast como LUT: mezcla con la luminancia media.
+    La media sale de las medias por canal (cv2.mean), sin convertir la imagen a gris."""
+    b, g, r = cv2.mean(img_cv)[:3] if img_cv.ndim == 3 else (cv2.mean(img_cv)[0],) * 3
+    mean = int(0.299 * r + 0.587 * g + 0.114 * b + 0.5)
+    return np.clip(mean + factor * (np.arange(256) - mean), 0, 255).astype(np.uint8)
+
+
+@functools.lru_cache(maxsize=16)
+def _sharpen_kernel(radius: float, amount: float, factor: float):
+    """Máscara de enfoque (radius, amount) seguida de ImageEnhance.Sharpness(factor)
+    compuestas en un único núcleo para cv2.filter2D (None si no hay nada que hacer).
+    El núcleo combinado se recorta al soporte de la gaussiana: los pesos descartados
+    son < 1 % y se devuelven al centro para conservar la suma 1."""
+    kernel = np.zeros((1, 1), np.float64)
+    kernel[0, 0] = 1.0
+    if amount:
+        ksize = int(round(radius * 3 * 2 + 1)) | 1       # mismo tamaño que GaussianBlur en 8 bits
+        g = cv2.getGaussianKernel(ksize, radius)
+        kernel = -amount * (g @ g.T)
+        kernel[ksize // 2, ksize // 2] += 1 + amount
+    if factor != 1.0:
+        # ImageEnhance.Sharpness mezcla con el filtro SMOOTH de PIL
+        smooth = np.array([[1, 1, 1], [1, 5, 1], [1, 1, 1]], np.float64) / 13
+        sharp = (1 - factor) * smooth
+        sharp[1, 1] += factor
+        n = kernel.shape[0]
+        full = cv2.filter2D(np.pad(kernel, 1), -1, sharp, borderType=cv2.BORDER_CONSTANT)
+        kernel = full[1:n + 1, 1:n + 1] if n > 1 else sharp
+    if kernel.shape == (1, 1):
+        return None
+    kernel = kernel.copy()
+    kernel[kernel.shape[0] // 2, kernel.shape[1] // 2] += 1.0 - kernel.sum()
+    return kernel.astype(np.float32)
+
+
+def _enhance_filters(img: Image.Image, settings: PipelineSettings,
+                     page_log: list[str] | None = None, stats: PageStats | None = None):
+    """Etapa 1: operadores locales (denoise, umbral, preset). No cambia el tamaño,
+    así que puede aplicarse por teselas con solape. Devuelve (BGR, enfoque pendiente):
+    la máscara de enfoque del preset se aplica en _finish_page junto con la nitidez.
+    `stats` permite reutilizar el análisis de la página a resolución completa
+    (la vista previa proxy no puede medir el ruido sobre la reducción)."""
+    # Análisis rápido de la página para decidir qué operadores caros hacen falta
+    if settings.adaptive_ops and stats is None:
+        stats = analyze_page(img)
+    elif not settings.adaptive_ops:
+        stats = None
+    path = []   # camino elegido (se registra en page_log si se pide)
+    sharpen = None
+
+    # Paso 0: básicos previos (compatibilidad con tus toggles). Una sola conversión
+    # PIL→OpenCV; mientras la página sea gris se trabaja con un único canal.
+    img_cv = _to_cv(img)
+    gray = cv2.cvtColor(img_cv, cv2.COLOR_BGR2GRAY) if settings.to_grayscale else None
+    if settings.auto_contrast:
+        if gray is not None:
+            gray = cv2.LUT(gray, _autocontrast_lut(gray))
+        else:
+            img_cv = cv2.LUT(img_cv, _autocontrast_lut(img_cv))
+    if settings.noise_reduction:
+        if stats and not stats.needs_denoise:
+            path.append("denoise:omitido")
+        elif gray is not None or (stats and stats.is_gray):
+            if gray is None:
+                gray = cv2.cvtColor(img_cv, cv2.COLOR_BGR2GRAY)
+            gray = _edge_denoise(gray, settings)
+            path.append("denoise:gris")
+        else:
+            img_cv = _edge_denoise(img_cv, settings)
+            path.append("denoise")
+    if settings.adaptive_threshold:
+        if gray is None:
+            gray = cv2.cvtColor(img_cv, cv2.COLOR_BGR2GRAY)
+        gray = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+                                     cv2.THRESH_BINARY, _px(35, settings, odd=True, minimum=3), 10)
+    if gray is not None:
+        img_cv = cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR)
+
+    # Preset legible
+    p = settings.preset.strip().lower()
+    if p.startswith("manga limpio"):
+        if stats and stats.spread >= SPREAD_FULL:
+            path.append("clahe:omitido")
+        else:
+            img_cv = _clahe_gray(img_cv, clip=2.0, tile=8)
+            path.append("clahe")
+        sharpen = (1.0, 0.6)
+
+    elif p.startswith("manga antiguo"):
+        img_cv = _clahe_gray(img_cv, clip=2.6, tile=8)
+        sharpen = (1.0, 0.5)
+        path.append("clahe")
+
+    elif p.startswith("escaneo con artefactos"):
+        if stats and not stats.needs_denoise:
+            path.append("nlmeans:omitido")
+        elif stats and stats.noise < NOISE_HIGH and stats.blockiness < BLOCKINESS_HIGH:
+            # ruido moderado sin bloques: bilateral basta
+            img_cv = _bilateral(img_cv, settings)
+            path.append("nlmeans→bilateral")
+        elif stats and stats.is_gray:
+            img_cv = _nl_means_gray(img_cv, settings, strength=6)
+            path.append("nlmeans:gris")
+        else:
+            img_cv = _nl_means(img_cv, settings, strength=6)
+            path.append("nlmeans")
+        sharpen = (1.2, 0.6)
+
+    elif p.startswith("texto pequeño"):
+        img_cv = _sauvola_like(img_cv, settings)
+
+    elif p.startswith("sólo recorte"):
+        pass  # se aplicará recorte/pad en _finish_page
+
+    if page_log is not None and stats:
+        page_log.append(f"{stats.describe()} → {', '.join(path) or 'sin filtros caros'}")
+    return img_cv, sharpen
+
+
+def _finish_page(img_cv, settings: PipelineSettings, sharpen: tuple[float, float] | None = None) -> Image.Image:
+    """Etapa 2: recorte + margen (o encuadre exacto al panel) y ajustes finos globales:
+    contraste como LUT y enfoque del preset + nitidez en una sola convolución."""
+    device = DEVICES.get(settings.device)
+    if device:
+        if settings.preview_scale < 1.0:
+            device = replace(device, width=_px(device.width, settings), height=_px(device.height, settings))
+        # el contenido ya se recortó y escaló en _fit_to_device: sólo falta encuadrar
+        img_cv = _letterbox(img_cv, device)
+    else:
+        # Recorte + margen
+        img_cv = _auto_trim_and_pad(img_cv, pad_px=_px(PAGE_PAD, settings))
+
+    # Ajustes finos globales
+    if settings.contrast_boost != 1.0:
+        img_cv = cv2.LUT(img_cv, _contrast_lut(img_cv, settings.contrast_boost))
+    radius, amount = sharpen or (0.0, 0.0)
+    kernel = _sharpen_kernel(round(radius * settings.preview_scale, 2), amount, settings.sharpness_boost)
+    if kernel is not None:
+        img_cv = cv2.filter2D(img_cv, -1, kernel)
+    img = _from_cv(img_cv)
+
+    if settings.eink_dither:
+        img = _apply_eink_dither(img)
+    return img
+
+
+def enhance_image_preset(img: Image.Image, settings: PipelineSettings,
+                         page_log: list[str] | None = None, stats: PageStats | None = None) -> Image.Image:
+    img_cv, sharpen = _enhance_filters(img, settings, page_log, stats)
+    return _finish_page(img_cv, settings, sharpen)
+
+
+# ---------------- Calidad JPEG por página ----------------
+JPEG_Q_MIN = 40             # suelo de la búsqueda de calidad por página
+SSIM_PROXY_SIDE = 512       # lado máximo del proxy sobre el que se prueban las calidades
+
+
+def _ssim(a, b) -> float:
+    # SSIM clásico (ventana gaussiana 11x11, sigma 1.5) sobre luminancia en float32
+    c1, c2 = (0.01 * 255) ** 2, (0.03 * 255) ** 2
+    a = a.astype(np.float32)
+    b = b.astype(np.float32)
+    blur = lambda m: cv2.GaussianBlur(m, (11, 11), 1.5)
+    mu_a, mu_b = blur(a), blur(b)
+    var_a = blur(a * a) - mu_a * mu_a
+    var_b = blur(b * b) - mu_b * mu_b
+    cov = blur(a * b) - mu_a * mu_b
+    num = (2 * mu_a * mu_b + c1) * (2 * cov + c2)
+    den = (mu_a * mu_a + mu_b * mu_b + c1) * (var_a + var_b + c2)
+    return float((num / den).mean())
+
+
+def search_jpeg_quality(img: Image.Image, target: float, q_max: int) -> int:
+    """Menor calidad JPEG (entre JPEG_Q_MIN y q_max) cuyo SSIM frente a la página
+    sin comprimir alcanza `target`. Las pruebas se hacen sobre un proxy reducido en
+    gris con cv2.imencode (pocos ms cada una); la calidad elegida se aplica luego a la
+    página completa. El proxy exagera algo los artefactos, así que el error es conservador."""
+    proxy = np.asarray(img.convert("L"))
+    scale = SSIM_PROXY_SIDE / max(proxy.shape)
+    if scale < 1:
+        proxy = cv2.resize(proxy, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+    def passes(q: int) -> bool:
+        ok, buf = cv2.imencode(".jpg", proxy, [cv2.IMWRITE_JPEG_QUALITY, q])
+        return ok and _ssim(proxy, cv2.imdecode(buf, cv2.IMREAD_GRAYSCALE)) >= target
+
+    lo, hi = JPEG_Q_MIN, max(JPEG_Q_MIN, int(q_max))
+    while lo < hi:      # búsqueda binaria (el SSIM crece con la calidad)
+        mid = (lo + hi) // 2
+        if passes(mid):
+            hi = mid
+        else:
+            lo = mid + 1
+    return lo
+
+
+def _save_jpeg(img: Image.Image, out: Path, settings: PipelineSettings,
+               page_log: list[str] | None = None) -> Path:
+    quality = int(settings.jpg_quality)
+    if settings.ssim_target:
+        quality = search_jpeg_quality(img, settings.ssim_target, quality)
+        if page_log is not None:
+            page_log.append(f"jpeg q={quality}")
+    # nombre temporal + rename: un worker terminado a mitad de página no deja un JPG a medias
+    part = out.with_name(out.name + ".part")
+    img.save(
+        part, "JPEG",
+        quality=quality,
+        optimize=True,
+        subsampling=0,      # 4:4:4
+        progressive=True
+    )
+    part.replace(out)
+    return out
+
+
+def _fit_width(img: Image.Image, settings: PipelineSettings) -> Image.Image:
+    if img.width > settings.target_width:
+        h = int(img.height * settings.target_width / img.width)
+        img = img.resize((settings.target_width, h), Image.Resampling.LANCZOS)
+    return img
+
+
+def _fit_for_output(img: Image.Image, settings: PipelineSettings, trim: bool = True) -> Image.Image:
+    device = DEVICES.get(settings.device)
+    return _fit_to_device(img, device, trim=trim) if device else _fit_width(img, settings)
+
+
+def _source_stats(img: Image.Image, settings: PipelineSettings) -> PageStats | None:
+    """Análisis sobre la imagen decodificada, antes de recortar o reescalar: el
+    reescalado LANCZOS borra la rejilla 8x8 y suaviza el ruido que analyze_page mide."""
+    return analyze_page(img) if settings.adaptive_ops else None
+
+
+# ---------------- Tiras verticales (webtoon) ----------------
+STRIP_MIN_ASPECT = 3.0          # alto/ancho a partir del cual una imagen se trata como tira
+STRIP_PAGE_ASPECT = 1448 / 1072 # proporción de página en modo libre (con dispositivo: la del panel)
+STRIP_MIN_FILL = 0.5            # un corte en hueco no deja páginas por debajo de este llenado
+STRIP_OVERLAP = 32              # px de contexto extra al filtrar alrededor de cada corte
+GUTTER_STD = 4.0                # desviación máxima de una fila para considerarla "hueco"
+GUTTER_MIN_ROWS = 12            # alto mínimo (px) de un hueco entre viñetas
+GUTTER_SCALE = 4                # factor de reducción para el perfil de filas
+
+
+def find_strip_cuts(img: Image.Image, page_h: int) -> tuple[list[int], int, list[tuple[int, int]]]:
+    """Calcula los cortes de una tira en huecos entre viñetas (filas uniformes).
+    Devuelve (cortes, nº de cortes forzados, huecos) con cortes = [0, ..., alto]."""
+    small = img.convert("L").reduce(GUTTER_SCALE) if img.height >= GUTTER_SCALE * 8 else img.convert("L")
+    scale = img.height / small.height
+    uniform = np.asarray(small, dtype=np.float32).std(axis=1) < GUTTER_STD
+
+    # Rachas de filas uniformes -> huecos en coordenadas de la tira original
+    gutters = []
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], uniform.view(np.int8), [0]))))
+    for start, end in zip(edges[::2], edges[1::2]):
+        if (end - start) * scale >= GUTTER_MIN_ROWS:
+            gutters.append((int(start * scale), int(end * scale)))
+    centers = [(a + b) // 2 for a, b in gutters]
+
+    cuts = [0]
+    forced = 0
+    while img.height - cuts[-1] > page_h:
+        lo = cuts[-1] + int(page_h * STRIP_MIN_FILL)
+        hi = cuts[-1] + page_h
+        window = [c for c in centers if lo <= c <= hi]
+        if window:
+            cuts.append(max(window))
+        else:
+            cuts.append(hi)
+            forced += 1
+    cuts.append(img.height)
+    return cuts, forced, gutters
+
+
+def process_strip(img: Image.Image, dest: Path, seq_num: int, settings: PipelineSettings,
+                  stats: PageStats | None = None) -> tuple[list[Path], str]:
+    """Divide una tira muy alta en páginas con proporción Kindle. Cada página se
+    filtra por separado (con STRIP_OVERLAP px de contexto), de modo que la memoria
+    de los operadores queda acotada al tamaño de una página y no de la tira.
+    Las salidas se llaman {seq_num:05d}_{k:03d}.jpg (ver renumber_pages).
+    `stats`: análisis de la tira original, común a todas sus páginas."""
+    device = DEVICES.get(settings.device)
+    page_h = int(img.width * (device.height / device.width if device else STRIP_PAGE_ASPECT))
+    cuts, forced, gutters = find_strip_cuts(img, page_h)
+    outputs = []
+    qualities = []
+    for y0, y1 in zip(cuts, cuts[1:]):
+        # segmentos que son enteramente hueco (espacio en blanco entre escenas) se omiten
+        if any(a <= y0 and y1 <= b for a, b in gutters):
+            continue
+        top = max(0, y0 - STRIP_OVERLAP)
+        bottom = min(img.height, y1 + STRIP_OVERLAP)
+        tile = _fit_for_output(img.crop((0, top, img.width, bottom)), settings, trim=False)
+        k = tile.height / (bottom - top)
+        tile_cv, sharpen = _enhance_filters(tile, settings, stats=stats)
+        tile_cv = tile_cv[int(round((y0 - top) * k)):int(round((y1 - top) * k))]
+        page = _finish_page(tile_cv, settings, sharpen)
+        outputs.append(_save_jpeg(page, dest / f"{seq_num:05d}_{len(outputs) + 1:03d}.jpg",
+                                  settings, page_log=qualities))
+    note = (f"tira {img.width}×{img.height} → {len(outputs)} página(s)"
+            + (f" ({forced} corte(s) sin hueco)" if forced else ""))
+    if qualities:
+        note += f" · {', '.join(qualities)}"
+    return outputs, note
+
+
+def renumber_pages(outputs: list[Path]) -> list[Path]:
+    """Renombra las salidas de un volumen (en orden) a 00001.jpg, 00002.jpg, ...
+    Las tiras añaden páginas y las páginas omitidas (blank_pages="drop") las quitan,
+    así que el número nuevo puede ser mayor o menor que el original: se pasa por
+    nombres temporales para que ningún renombrado pise otra salida."""
+    final = [p.with_name(f"{n:05d}.jpg") for n, p in enumerate(outputs, start=1)]
+    moves = [(src, dst) for src, dst in zip(outputs, final) if src != dst]
+    staged = []
+    for src, dst in moves:
+        tmp = src.with_name(f"~{dst.name}")
+        src.replace(tmp)
+        staged.append((tmp, dst))
+    for tmp, dst in staged:
+        tmp.replace(dst)
+    return final
+
+
+def clear_page_outputs(dest: Path, seq_num: int):
+    """Borra lo que un intento de la página seq_num dejó en `dest`: salidas completas
+    ({seq_num:05d}.jpg, _NNN de dobles y tiras) y temporales .part."""
+    for pattern in (f"{seq_num:05d}*.jpg", f"{seq_num:05d}*.jpg.part"):
+        for leftover in dest.glob(pattern):
+            leftover.unlink(missing_ok=True)
+
+
+def process_spread(img: Image.Image, dest: Path, seq_num: int, settings: PipelineSettings,
+                   stats: PageStats | None = None) -> tuple[list[Path], str]:
+    """Página doble (apaisada) en modo dispositivo: KCC ya no la divide (--noprocessing),
+    así que se parte aquí en dos páginas, derecha primero (lectura manga)."""
+    half = img.width // 2
+    outputs = []
+    for k, box in enumerate(((half, 0, img.width, img.height), (0, 0, half, img.height)), start=1):
+        page = enhance_image_preset(_fit_for_output(img.crop(box), settings), settings, stats=stats)
+        outputs.append(_save_jpeg(page, dest / f"{seq_num:05d}_{k:03d}.jpg", settings))
+    return outputs, f"página doble {img.width}×{img.height} → 2 páginas"
+
+
+# ---------------- Páginas en blanco / uniformes ----------------
+BLANK_PROBE_SIDE = 256      # lado de la sonda (con JPEG, draft() decodifica ya reducido por DCT)
+BLANK_DELTA = 24            # desviación respecto a la mediana que cuenta como "tinta"
+BLANK_INK_FRAC = 0.0005     # fracción de tinta tolerada (polvo, número de página diminuto)
+BLANK_SNAP = 16             # niveles a menos de esto del blanco/negro se llevan al extremo
+BLANK_JPEG_QUALITY = 50
+
+
+def probe_blank(src: Path | Image.Image) -> tuple[int, tuple[int, int]] | None:
+    """(nivel de gris, tamaño original) si la página es uniforme —en blanco, separador
+    negro, casi vacía—; None si tiene contenido. Con una ruta sólo se decodifica una
+    reducción (draft, efectivo con JPEG); también acepta la imagen ya decodificada."""
+    if isinstance(src, Path):
+        with Image.open(src) as im:
+            size = im.size
+            im.draft("L", (BLANK_PROBE_SIDE, BLANK_PROBE_SIDE))
+            probe = im.convert("L")
+    else:
+        size = src.size
+        probe = src.reduce(max(1, min(size) // BLANK_PROBE_SIDE)).convert("L")
+    probe.thumbnail((BLANK_PROBE_SIDE, BLANK_PROBE_SIDE), Image.Resampling.BILINEAR)
+    arr = np.asarray(probe, dtype=np.int16)
+    level = int(np.median(arr))
+    ink = np.count_nonzero(np.abs(arr - level) > BLANK_DELTA)
+    if ink > BLANK_INK_FRAC * arr.size:
+        return None
+    if level >= 255 - BLANK_SNAP:
+        level = 255
+    elif level <= BLANK_SNAP:
+        level = 0
+    return level, size
+
+
+@functools.lru_cache(maxsize=32)
+def _minimal_page(size: tuple[int, int], level: int) -> bytes:
+    """JPEG de un solo nivel, codificado una vez por tamaño y nivel (por proceso)."""
+    buf = io.BytesIO()
+    Image.new("L", size, level).save(buf, "JPEG", quality=BLANK_JPEG_QUALITY)
+    return buf.getvalue()
+
+
+def write_blank_page(blank: tuple[int, tuple[int, int]], dest: Path, seq_num: int,
+                     settings: PipelineSettings) -> tuple[list[Path], str]:
+    """Salida de una página uniforme sin pasar por la cadena: ninguna (drop) o la
+    página mínima precalculada con la geometría de salida."""
+    level, (w, h) = blank
+    if settings.blank_pages == "drop":
+        return [], f"uniforme (gris {level}) → omitida"
+    device = DEVICES.get(settings.device)
+    if device:
+        size = (device.width, device.height)
+    elif w > settings.target_width:
+        size = (settings.target_width, max(1, round(h * settings.target_width / w)))
+    else:
+        size = (w, h)
+    out = dest / f"{seq_num:05d}.jpg"
+    part = out.with_name(out.name + ".part")
+    part.write_bytes(_minimal_page(size, level))
+    part.replace(out)
+    return [out], f"uniforme (gris {level}) → página mínima"
+
+
+def open_page(path: Path, settings: PipelineSettings) -> tuple[Image.Image | None, tuple | None]:
+    """(imagen RGB, None) o, si la página es uniforme y blank_pages lo pide, (None, sonda).
+    Un JPEG se sondea antes de decodificarlo; el resto, sobre la imagen ya decodificada
+    (sin decodificar dos veces). Con reduced_decode la imagen llega ya reducida:
+    escala DCT en JPEG, reduce() entero en los demás formatos."""
+    check = settings.blank_pages != "off"
+    img = Image.open(path)
+    jpeg = img.format == "JPEG"
+    if check and jpeg:
+        blank = probe_blank(path)
+        if blank is not None:
+            img.close()
+            return None, blank
+    device = DEVICES.get(settings.device)
+    target = (device.width, device.height) if device else (settings.target_width, 1)
+    if settings.reduced_decode and jpeg:
+        img.draft("RGB", target)
+    img = img.convert("RGB")
+    if settings.reduced_decode and not jpeg:
+        factor = min(img.width // target[0], img.height // target[1])
+        if factor >= 2:
+            img = img.reduce(factor)
+    if check and not jpeg:
+        blank = probe_blank(img)
+        if blank is not None:
+            return None, blank
+    return img, None
+
+
+def process_page(path: Path, dest: Path, seq_num: int,
+                 settings: PipelineSettings) -> tuple[list[Path], str | None, str | None]:
+    """Procesa una página y la guarda como {seq_num:05d}.jpg (o varias, si es una
+    tira en modo webtoon). Devuelve (salidas, nota, error); se ejecuta en procesos worker."""
+    try:
+        img, blank = open_page(path, settings)
+        if blank is not None:
+            return (*write_blank_page(blank, dest, seq_num, settings), None)
+        stats = _source_stats(img, settings)
+        if settings.strip_mode and img.height >= STRIP_MIN_ASPECT * img.width:
+            return (*process_strip(img, dest, seq_num, settings, stats), None)
+        if settings.device and img.width > img.height:
+            return (*process_spread(img, dest, seq_num, settings, stats), None)
+        img = _fit_for_output(img, settings)
+        page_log = []
+        img = enhance_image_preset(img, settings, page_log=page_log, stats=stats)
+        out = _save_jpeg(img, dest / f"{seq_num:05d}.jpg", settings, page_log=page_log)
+        return [out], (" · ".join(page_log) or None), None
+    except Exception as e:
+        return [], None, str(e)
+
+
+# ---------------- Fan-out a varios dispositivos ----------------
+def _fan_out_page(img: Image.Image, dests: dict[str, Path], name: str, settings: PipelineSettings,
+                  page_log: list[str] | None = None, stats: PageStats | None = None) -> list[Path]:
+    """Una página para varios dispositivos: recorte y etapa 1 (denoise, CLAHE, umbral...)
+    una sola vez, a la resolución del panel mayor; después, por dispositivo, sólo
+    reducción INTER_AREA, encuadre, contraste/enfoque y JPEG."""
+    bbox = _content_bbox(img)
+    if bbox:
+        img = img.crop(bbox)
+    sizes = {key: _device_size(img.size, DEVICES[key]) for key in dests}
+    master_size = max(sizes.values())
+    if master_size != img.size:
+        img = img.resize(master_size, Image.Resampling.LANCZOS)
+    img_cv, sharpen = _enhance_filters(img, settings, page_log, stats=stats)
+    outputs = []
+    for key, dest in dests.items():
+        size = sizes[key]
+        page_cv = img_cv if size == master_size else cv2.resize(img_cv, size, interpolation=cv2.INTER_AREA)
+        dev_settings = replace(settings, device=key)
+        page = _finish_page(page_cv, dev_settings, sharpen)
+        outputs.append(_save_jpeg(page, dest / name, dev_settings,
+                                  page_log=page_log if key == settings.device else None))
+    return outputs
+
+
+def process_page_multi(path: Path, dests: dict[str, Path], seq_num: int,
+                       settings: PipelineSettings) -> tuple[dict[str, list[Path]], str | None, str | None]:
+    """Como process_page, pero escribe la página en la carpeta de cada dispositivo
+    de `dests` (clave de DEVICES -> carpeta) con una sola decodificación y una sola
+    pasada de filtros. Devuelve ({clave: salidas}, nota, error)."""
+    try:
+        img, blank = open_page(path, replace(settings, device=max(dests, key=lambda k: DEVICES[k].width)))
+        if blank is not None:
+            outputs = {}
+            for key, dest in dests.items():
+                outputs[key], note = write_blank_page(blank, dest, seq_num, replace(settings, device=key))
+            return outputs, note, None
+        stats = _source_stats(img, settings)
+        if settings.strip_mode and img.height >= STRIP_MIN_ASPECT * img.width:
+            # los cortes dependen de la proporción de cada panel: se filtra por
+            # dispositivo, pero la imagen se decodifica una sola vez
+            outputs, notes = {}, []
+            for key, dest in dests.items():
+                outputs[key], note = process_strip(img, dest, seq_num, replace(settings, device=key), stats)
+                notes.append(f"{key}: {note}")
+            return outputs, " · ".join(notes), None
+        if img.width > img.height:
+            half = img.width // 2
+            halves = (img.crop((half, 0, img.width, img.height)), img.crop((0, 0, half, img.height)))
+            pages = [(h, f"{seq_num:05d}_{k:03d}.jpg") for k, h in enumerate(halves, start=1)]
+            note = f"página doble {img.width}×{img.height} → 2 páginas"
+        else:
+            pages = [(img, f"{seq_num:05d}.jpg")]
+            note = None
+        outputs = {key: [] for key in dests}
+        page_log = []
+        for page, name in pages:
+            for key, out in zip(dests, _fan_out_page(page, dests, name, settings,
+                                                      page_log if note is None else None, stats)):
+                outputs[key].append(out)
+        return outputs, note or (" · ".join(page_log) or None), None
+    except Exception as e:
+        return {}, None, str(e)
+
+
+# ---------------- Presupuesto por página ----------------
+PAGE_TIME_BUDGET_S = 60         # por defecto; una página que lo excede se repite con la cadena de reserva
+PAGE_MEM_BUDGET_MB = 1024
+PAGE_MEM_BYTES_PER_PX = 8       # pico estimado al decodificar: RGB + gris del recorte + copias de OpenCV
+FALLBACK_PRESET = "Manga limpio (rápido)"
+
+_budget_events = None           # SimpleQueue worker -> proceso principal: (clave, motivo de reserva o None = expirada)
+
+
+@dataclass
+class PageJob:
+    key: tuple[int, int]        # (volumen, índice): lo que el worker devuelve al expirar
+    src: Path
+    fn: object                  # process_page | process_page_multi
+    dest: object                # carpeta, o {clave: carpeta} en fan-out
+    seq: int
+    settings: PipelineSettings
+    result: object = None       # AsyncResult del intento en curso
+    reason: str | None = None   # por qué se pasó a la cadena de reserva
+
+
+def _init_page_worker(events):
+    global _budget_events
+    _ignore_sigint()
+    _budget_events = events
+    # imports pesados al arrancar el worker: el presupuesto mide sólo el trabajo de la página
+    for alias in ("cv2", "np", "Image"):
+        globals()[alias] = _import_heavy(alias)
+
+
+def fallback_settings(settings: PipelineSettings) -> PipelineSettings:
+    """Cadena de reserva: CLAHE + enfoque, denoise de luminancia, decodificación
+    reducida y calidad JPEG fija. Conserva geometría, grises y dispositivo."""
+    return replace(settings, preset=FALLBACK_PRESET, denoise="fast", ssim_target=0.0,
+                   binarize_stats_scale=0.5, adaptive_ops=True, reduced_decode=True)
+
+
+def _page_expired(reason: str, multi: bool):
+    return ({} if multi else []), None, "excede el presupuesto también con la cadena de reserva", reason
+
+
+def run_page_job(key: tuple[int, int], fn, path: Path, dest, seq_num: int, settings: PipelineSettings,
+                 budget_s: float, mem_mb: int):
+    """Envoltorio en el worker de process_page/process_page_multi con presupuesto:
+    - memoria: estimada con el tamaño de la cabecera; si no cabe, se usa directamente
+      la cadena de reserva y se avisa al proceso principal (que la anota en el PageJob);
+    - tiempo: un temporizador termina el worker si la página no acaba a tiempo y
+      avisa al proceso principal (por _budget_events) para que la repita con la reserva.
+    Devuelve (salidas, nota, error, motivo de la reserva o None); una cabecera
+    ilegible cuenta como página fallida, igual que los errores de la cadena."""
+    reason = None
+    if mem_mb and not settings.reduced_decode:
+        try:
+            with Image.open(path) as im:
+                need = im.width * im.height * PAGE_MEM_BYTES_PER_PX
+        except Exception as e:
+            return ({} if fn is process_page_multi else []), None, str(e), None
+        if need > mem_mb * 2**20:
+            reason = f"memoria ~{need / 2**20:.0f} MB > {mem_mb} MB"
+            settings = fallback_settings(settings)
+            if _budget_events is not None:
+                _budget_events.put((key, reason))
+    lock = threading.Lock()
+    finished = False
+
+    def expire():
+        with lock:
+            if not finished:
+                # SimpleQueue.put escribe en la tubería de forma síncrona: llega antes del _exit
+                _budget_events.put((key, None))
+                os._exit(1)
+
+    timer = threading.Timer(budget_s, expire) if budget_s and _budget_events is not None else None
+    if timer:
+        timer.daemon = True
+        timer.start()
+    try:
+        return (*fn(path, dest, seq_num, settings), reason)
+    finally:
+        with lock:
+            finished = True
+        if timer:
+            timer.cancel()
+
+
+# -------------------------- Procesos externos --------------------------
+CANCEL_POLL_S = 0.2     # latencia máxima de reacción a "Cancelar"
+
+
+def kill_process_tree(proc: subprocess.Popen):
+    """Mata el proceso y sus descendientes (KCC lanza kindlegen como hijo)."""
+    if proc.poll() is not None:
+        return
+    try:
+        if sys.platform == "win32":
+            subprocess.run(["taskkill", "/F", "/T", "/PID", str(proc.pid)],
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        else:
+            os.killpg(proc.pid, signal.SIGKILL)
+    except Exception:
+        proc.kill()
+
+
+def run_cancellable(cmd: list[str], cancel_event: threading.Event,
+                    **popen_kwargs) -> tuple[int | None, str, str]:
+    """Como subprocess.run, pero vigila cancel_event mientras espera.
+    Devuelve (returncode, stdout, stderr); returncode=None si se canceló."""
+    if sys.platform == "win32":
+        popen_kwargs["creationflags"] = subprocess.CREATE_NEW_PROCESS_GROUP
+    else:
+        popen_kwargs["start_new_session"] = True   # grupo propio para killpg
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                            text=True, shell=False, **popen_kwargs)
+    while True:
+        try:
+            stdout, stderr = proc.communicate(timeout=CANCEL_POLL_S)
+            return proc.returncode, stdout, stderr
+        except subprocess.TimeoutExpired:
+            if cancel_event.is_set():
+                kill_process_tree(proc)
+                try:
+                    stdout, stderr = proc.communicate(timeout=5)
+                except subprocess.TimeoutExpired:
+                    stdout, stderr = "", ""
+                return None, stdout or "", stderr or ""
+
+
+# -------------------------- Escaneo y plan --------------------------
+IMAGE_FORMATS = {'.jpg', '.jpeg', '.png', '.webp'}
+
+
+def scan_chapters(folder: Path, profile: SourceProfile, subfolders: bool = True) -> list[Chapter]:
+    chapters = []
+    if profile.expects_subfolders and subfolders:
+        subdirs = [d for d in folder.iterdir() if d.is_dir()]
+        subdirs.sort(key=profile.sort_chapter_key)
+        for sub in subdirs:
+            files = [f for f in sub.iterdir() if f.is_file() and f.suffix.lower() in IMAGE_FORMATS]
+            files.sort(key=profile.sort_image_key)
+            if files:
+                chapters.append(Chapter(name=sub.name, dir=sub, images=files))
+    else:
+        files = [f for f in folder.iterdir() if f.is_file() and f.suffix.lower() in IMAGE_FORMATS]
+        files.sort(key=profile.sort_image_key)
+        if files:
+            chapters.append(Chapter(name=folder.name, dir=folder, images=files))
+    return chapters
+
+
+def plan_volumes(chapters: list[Chapter], group_size: int) -> list[list[Chapter]]:
+    enabled = [c for c in chapters if c.enabled]
+    g = max(1, int(group_size))
+    return [enabled[i:i+g] for i in range(0, len(enabled), g)]
+
+
+# -------------------------- Conversión (sin Tk) --------------------------
+@dataclass(frozen=True)
+class RunOptions:
+    series: str
+    author: str = ""
+    start_volume: int = 1
+    workers: int = 1
+    clean_temp_before: bool = True
+    clean_ebooks_before: bool = True
+    kp3_dir: str = ""
+    replace_existing: bool = False      # sobrescribir "Serie - vNN.mobi" en vez de añadir fecha
+    ram_stage_mb: int = 1024            # presupuesto de staging en RAM (0 = siempre en disco)
+    ram_stage_dir: str = ""             # tmpfs/ramdisk; "" = automático (/dev/shm si existe)
+    page_budget_s: float = PAGE_TIME_BUDGET_S   # tiempo máximo por página (0 = sin límite)
+    page_mem_mb: int = PAGE_MEM_BUDGET_MB       # memoria estimada máxima por página (0 = sin límite)
+    devices: tuple[str, ...] = ()       # fan-out: claves de DEVICES, un MOBI por dispositivo en ebooks/<clave>/
+    writer: str = "kcc"                 # "kcc" (KCC + kindlegen, MOBI) | "azw3" (escritor KF8 nativo, kf8.py)
+
+
+@functools.lru_cache(maxsize=None)
+def _find_kindlegen(base_path: Path, previewer_root: str) -> Path | None:
+    # El rglob sobre Kindle Previewer es lento: se hace una vez por ruta y sesión
+    local_kg = base_path / "kindlegen.exe"
+    if local_kg.exists():
+        return local_kg
+    root = Path(previewer_root)
+    if previewer_root and root.exists():
+        return next(root.rglob("kindlegen.exe"), None)
+    return None
+
+
+def default_ram_dir() -> Path | None:
+    """Directorio en RAM para el staging: /dev/shm en Linux. En Windows no hay tmpfs;
+    hay que indicar la unidad de un ramdisk (p. ej. ImDisk) en ram_stage_dir."""
+    shm = Path("/dev/shm")
+    return shm if shm.is_dir() and os.access(shm, os.W_OK) else None
+
+
+STAGE_RAM_MARGIN = 64 * 1024 * 1024     # espacio que se deja libre en el tmpfs
+
+
+class VolumeStager:
+    """Elige dónde se escriben las páginas de cada volumen antes de KCC: en RAM
+    mientras el volumen quepa en el presupuesto (y en el espacio libre del tmpfs),
+    en temp/ del disco si no. Un volumen entero va a un solo sitio porque KCC lee
+    una carpeta. El tamaño se estima con los bytes de las imágenes fuente por la
+    relación salida/fuente observada en los volúmenes anteriores."""
+
+    def __init__(self, disk_dir: Path, ram_dir: Path | None, budget_mb: int, log=print):
+        self.disk_dir = disk_dir
+        self.budget = max(0, budget_mb) * 1024 * 1024
+        self.log = log
+        self.ratio = 1.0            # bytes JPG salida / bytes fuente (conservador al principio)
+        self.ram_root = None
+        if ram_dir is not None and self.budget:
+            try:
+                self.ram_root = Path(tempfile.mkdtemp(prefix="kmo_", dir=ram_dir))
+            except OSError as e:
+                self.log(f"⚠ Staging en RAM no disponible ({e}); se usa el disco.")
+        self._src_bytes: dict[Path, int] = {}
+
+    def stage(self, vnum: int, vol: list[Chapter], copies: int = 1) -> Path:
+        """`copies`: salidas por página fuente (una por dispositivo en fan-out)."""
+        name = f"vol_{vnum:02d}"
+        src = sum(img.stat().st_size for ch in vol for img in ch.images) * max(1, copies)
+        if self.ram_root is not None:
+            room = min(self.budget, shutil.disk_usage(self.ram_root).free - STAGE_RAM_MARGIN)
+            if src * self.ratio <= room:
+                path = self.ram_root / name
+                path.mkdir()
+                self._src_bytes[path] = src
+                return path
+            self.log(f"v{vnum:02d}: ~{src * self.ratio / 2**20:.0f} MB no caben en RAM; staging en disco.")
+        path = self.disk_dir / name
+        shutil.rmtree(path, ignore_errors=True)
+        path.mkdir(parents=True, exist_ok=True)
+        return path
+
+    def release(self, path: Path, packaged: bool) -> Path | None:
+        """Tras KCC: el volumen empaquetado se borra en el acto. Uno fallido se
+        conserva en disco para inspeccionarlo (si estaba en RAM, se mueve a temp/),
+        pero nunca ocupa la RAM. Devuelve dónde quedó el volumen conservado."""
+        src = self._src_bytes.pop(path, None)
+        if src:
+            out = sum(f.stat().st_size for f in path.rglob("*.jpg"))
+            self.ratio = max(0.1, out / src)
+        if packaged:
+            shutil.rmtree(path, ignore_errors=True)
+            return None
+        if not src:
+            return path
+        kept = self.disk_dir / path.name
+        try:
+            shutil.rmtree(kept, ignore_errors=True)
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+            shutil.move(str(path), str(kept))
+        except OSError as e:
+            self.log(f"⚠ No se pudo conservar {path.name} en disco: {e}")
+            shutil.rmtree(path, ignore_errors=True)
+            shutil.rmtree(kept, ignore_errors=True)
+            return None
+        return kept
+
+    def close(self):
+        if self.ram_root is not None:
+            shutil.rmtree(self.ram_root, ignore_errors=True)
+
+
+def _ignore_sigint():
+    # Ctrl+C lo gestiona el proceso principal (cancel_event); los workers lo ignoran
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+class Converter:
+    """Conversión completa según el plan: páginas -> vol_NN (RAM o temp/) -> KCC -> ebooks/.
+    No toca Tk; la usan la UI (desde su hilo worker) y el modo --headless."""
+
+    def __init__(self, base_path: Path, settings: PipelineSettings, options: RunOptions,
+                 cancel_event: threading.Event | None = None, log=print,
+                 progress=None, status=None, work_dir: Path | None = None):
+        self.base_path = base_path      # donde están KCC/kindlegen
+        # temp/ y ebooks/ cuelgan de work_dir (por defecto base_path); el daemon
+        # de la cola usa uno por trabajo para poder convertir series en paralelo
+        self.temp_dir = (work_dir or base_path) / 'temp'
+        self.ebooks_dir = (work_dir or base_path) / 'ebooks'
+        self.settings = settings
+        self.options = options
+        self.cancel_event = cancel_event or threading.Event()
+        self.log = log
+        # progress(kind, maximum, value) con kind "volumes" | "pages"
+        self._progress = progress or (lambda kind, maximum=None, value=None: None)
+        self._status = status or (lambda text: None)
+        self._budget_events = None
+        self._pool_tainted = False      # algún worker se terminó por presupuesto
+        self._volume_toc: dict[str, list[tuple[str, int]]] = {}    # clave -> (capítulo, 1.ª página)
+        # informe de la ejecución: ebooks/<serie>.report.json
+        self.report = {"series": options.series, "fallback_preset": FALLBACK_PRESET,
+                       "page_budget_s": options.page_budget_s, "page_mem_mb": options.page_mem_mb,
+                       "completed": [], "fallbacks": [], "failed_pages": []}
+
+    def _start_page_pool(self):
+        # "spawn" en todas las plataformas: mismo comportamiento que en Windows
+        # y los workers no heredan el estado de Tk del proceso principal.
+        ctx = multiprocessing.get_context("spawn")
+        self._budget_events = ctx.SimpleQueue()
+        return ctx.Pool(processes=max(1, self.options.workers),
+                        initializer=_init_page_worker, initargs=(self._budget_events,))
+
+    def _submit(self, pool, job: PageJob):
+        job.result = pool.apply_async(run_page_job, (job.key, job.fn, job.src, job.dest, job.seq, job.settings,
+                                                     self.options.page_budget_s, self.options.page_mem_mb))
+
+    def _check_budget(self, pool, jobs: list[PageJob]):
+        """Páginas cuyo worker expiró: se repiten con la cadena de reserva (o, si ya
+        era la reserva, se dan por fallidas). El resultado perdido del intento queda
+        en la caché del pool, así que al final el pool se termina en vez de cerrarse.
+        Los avisos de memoria sólo anotan en el trabajo que ya corre con la reserva."""
+        while not self._budget_events.empty():
+            (vnum, i), reason = self._budget_events.get()
+            if not jobs or vnum != jobs[0].key[0] or not 0 <= i < len(jobs):
+                continue    # aviso tardío de un volumen ya terminado
+            job = jobs[i]
+            if reason is not None:
+                job.reason = reason
+                job.settings = fallback_settings(job.settings)
+                continue
+            self._pool_tainted = True
+            budget = f"tiempo > {self.options.page_budget_s:g} s"
+            self._clear_job_outputs(job)
+            if job.settings.reduced_decode:
+                job.result = pool.apply_async(_page_expired, (job.reason or budget, job.fn is process_page_multi))
+                continue
+            job.reason = budget
+            job.settings = fallback_settings(job.settings)
+            self.log(f"⏱ {job.src.name}: {budget}; se repite con la cadena de reserva.")
+            self._submit(pool, job)
+
+    @staticmethod
+    def _clear_job_outputs(job: PageJob):
+        for dest in (job.dest.values() if isinstance(job.dest, dict) else (job.dest,)):
+            clear_page_outputs(dest, job.seq)
+
+    def _export_volume_pages(self, pool, vol: list[Chapter], vol_tmp: Path, vnum: int) -> bool:
+        """Exporta las páginas del volumen en el pool. Devuelve False si se canceló;
+        en ese caso el pool queda terminado (workers incluidos). En fan-out cada
+        dispositivo recibe su subcarpeta vol_NN/<clave>/."""
+        dests = {key: vol_tmp / key for key in self.options.devices}
+        for dest in dests.values():
+            dest.mkdir(exist_ok=True)
+        fn, dest = (process_page_multi, dests) if dests else (process_page, vol_tmp)
+        jobs: list[PageJob] = []
+        chapter_at: dict[int, str] = {}     # primer trabajo de cada capítulo -> nombre (índice del AZW3)
+        for ch in vol:
+            if ch.images:
+                chapter_at[len(jobs)] = ch.name
+            for img in ch.images:
+                job = PageJob((vnum, len(jobs)), img, fn, dest, len(jobs) + 1, self.settings)
+                self._submit(pool, job)
+                jobs.append(job)
+
+        outputs: dict[str, list[Path]] = {key: [] for key in dests or ("",)}
+        self._volume_toc = {key: [] for key in outputs}
+        for done, job in enumerate(jobs, start=1):
+            while not job.result.ready():
+                if self.cancel_event.wait(CANCEL_POLL_S):
+                    pool.terminate()
+                    return False
+                self._check_budget(pool, jobs)
+            outs, note, err, reason = job.result.get()
+            src = job.src
+            if not dests:
+                outs = {"": outs}
+            first = next((o[0].name for o in outs.values() if o), "—")
+            reason = job.reason or reason
+            if reason:
+                self.report["fallbacks"].append({"volume": vnum, "page": str(src), "reason": reason})
+                self.log(f"⏱ {src.name}: {reason} → cadena de reserva ({FALLBACK_PRESET})")
+            if err:
+                self._clear_job_outputs(job)    # salidas a medias (p. ej. una mitad de página doble)
+                outs = {key: [] for key in outputs}
+                self.report["failed_pages"].append({"volume": vnum, "page": str(src), "error": err})
+                self.log(f"Error procesando {src.name}: {err}")
+            elif note:
+                self.log(f"[página] {first} ({src.name}): {note}")
+            for key, paths in outs.items():
+                if done - 1 in chapter_at:
+                    self._volume_toc[key].append((chapter_at[done - 1], len(outputs[key])))
+                outputs[key].extend(paths)
+            self._progress("pages", value=done)
+        for paths in outputs.values():
+            if any("_" in p.stem for p in paths):
+                renumber_pages(paths)   # las tiras divididas entran en la numeración secuencial
+        return True
+
+    def run(self, plan: list[list[Chapter]]) -> list[int]:
+        """Convierte el plan y devuelve los números de volumen completados."""
+        completed: list[int] = []
+        interrupted: int | None = None
+        pending: list[int] = []
+        pool = None
+        stager = None
+        try:
+            temp_dir = self.temp_dir
+            ebooks_dir = self.ebooks_dir
+
+            if self.options.clean_temp_before:
+                shutil.rmtree(temp_dir, ignore_errors=True)
+            temp_dir.mkdir(parents=True, exist_ok=True)
+
+            if self.options.clean_ebooks_before:
+                shutil.rmtree(ebooks_dir, ignore_errors=True)
+            ebooks_dir.mkdir(parents=True, exist_ok=True)
+
+            series = self.options.series
+            total_vols = len(plan)
+            self.log(f"Inicio de conversión: {total_vols} volúmen(es). Serie: {series}")
+            self.report["started"] = datetime.now().isoformat(timespec="seconds")
+
+            self._progress("volumes", maximum=total_vols, value=0)
+            ram_dir = Path(self.options.ram_stage_dir) if self.options.ram_stage_dir else default_ram_dir()
+            stager = VolumeStager(temp_dir, ram_dir, self.options.ram_stage_mb, log=self.log)
+            pool = self._start_page_pool()
+
+            start_v = max(1, int(self.options.start_volume))
+            for idx, vol in enumerate(plan):
+                vnum = start_v + idx
+                if self.cancel_event.is_set():
+                    pending = [start_v + i for i in range(idx, total_vols)]
+                    break
+
+                vol_tmp = stager.stage(vnum, vol, copies=len(self.options.devices))
+
+                total_imgs = sum(len(ch.images) for ch in vol)
+                self._progress("pages", maximum=max(1, total_imgs), value=0)
+                self._status(f"v{vnum:02d}: exportando {total_imgs} página(s)...")
+                exported = self._export_volume_pages(pool, vol, vol_tmp, vnum)
+
+                if exported:
+                    self._status(f"v{vnum:02d}: empaquetando con {self._writer_label}...")
+                ok = exported and self._package_volume(vol_tmp, series, vnum)
+                kept = stager.release(vol_tmp, ok)
+                if self.cancel_event.is_set() and not ok:
+                    # volumen a medias: no dejamos temp/vol_NN parcial
+                    if kept is not None:
+                        shutil.rmtree(kept, ignore_errors=True)
+                    interrupted = vnum
+                    pending = [start_v + i for i in range(idx + 1, total_vols)]
+                    break
+                if ok:
+                    completed.append(vnum)
+                    self.report["completed"].append(vnum)
+                else:
+                    self.log(f"❌ Falló conversión del volumen v{vnum:02d} (continuando con el siguiente).")
+                    if kept is not None and kept.exists():
+                        self.log(f"   Páginas conservadas en {kept}")
+
+                self._progress("volumes", value=idx + 1)
+
+            if self.cancel_event.is_set():
+                self.log("⛔ Proceso cancelado por el usuario.")
+                self.log("   Completados: " + (", ".join(f"v{n:02d}" for n in completed) or "ninguno"))
+                if interrupted is not None:
+                    self.log(f"   Interrumpido (salida parcial eliminada): v{interrupted:02d}")
+                if pending:
+                    self.log("   Sin procesar: " + ", ".join(f"v{n:02d}" for n in pending))
+            else:
+                books = len(completed) * max(1, len(self.options.devices))
+                fmt = "AZW3" if self.options.writer == "azw3" else "MOBI"
+                self.log(f"✅ Proceso finalizado. {books} archivo(s) {fmt} generados.")
+            fallbacks, failed = self.report["fallbacks"], self.report["failed_pages"]
+            if fallbacks or failed:
+                self.log(f"   Páginas con cadena de reserva: {len(fallbacks)} · con error: {len(failed)}")
+            self._write_report(ebooks_dir / f"{series}.report.json")
+            return completed
+        finally:
+            if pool is not None:
+                if self.cancel_event.is_set() or self._pool_tainted:
+                    pool.terminate()
+                else:
+                    pool.close()
+                pool.join()
+            if stager is not None:
+                stager.close()
+
+    @property
+    def _writer_label(self) -> str:
+        return "kf8" if self.options.writer == "azw3" else "KCC"
+
+    def _package_volume(self, vol_tmp: Path, series: str, vnum: int) -> bool:
+        """Un trabajo de empaquetado (KCC o AZW3 nativo) por dispositivo (fan-out) o uno
+        solo. El volumen sólo cuenta como completado si se empaquetaron todos."""
+        package = self.write_azw3 if self.options.writer == "azw3" else self.convert_folder_to_mobi
+        if not self.options.devices:
+            return package(vol_tmp, f"{series} - v{vnum:02d}", series_title=series, volume_index=vnum)
+        failed = []
+        for key in self.options.devices:
+            if self.cancel_event.is_set():
+                return False
+            self._status(f"v{vnum:02d}: empaquetando con {self._writer_label} ({key})...")
+            if not package(vol_tmp / key, f"{series} - v{vnum:02d}",
+                           series_title=series, volume_index=vnum, device=key):
+                failed.append(key)
+        if failed:
+            self.log(f"❌ v{vnum:02d}: falló el empaquetado para {', '.join(failed)}.")
+        return not failed
+
+    def _write_report(self, path: Path):
+        self.report["finished"] = datetime.now().isoformat(timespec="seconds")
+        try:
+            path.write_text(json.dumps(self.report, ensure_ascii=False, indent=1), encoding="utf-8")
+        except OSError as e:
+            self.log(f"⚠ No se pudo escribir el informe {path.name}: {e}")
+
+    # ---------------- Localización de KCC / KindleGen ----------------
+    def resolve_kcc_exe(self) -> Path | None:
+        candidates = sorted(self.base_path.glob("KCC_c2e_*.exe"))
+        if not candidates:
+            return None
+        return candidates[-1]
+
+    def ensure_kindlegen_in_path(self) -> Path | None:
+        kg = _find_kindlegen(self.base_path, self.options.kp3_dir.strip('"'))
+        if kg is None:
+            self.log("⚠ No se encontró kindlegen.exe. KCC podría fallar con 'KindleGen is missing!'")
+            return None
+        kg_dir = str(kg.parent)
+        if kg_dir not in os.environ.get("PATH", "").split(os.pathsep):
+            os.environ["PATH"] = kg_dir + os.pathsep + os.environ.get("PATH", "")
+            self.log(f"kindlegen.exe encontrado: {kg} (añadido al PATH)")
+        return kg
+
+    # ---------------- KCC (MOBI) ----------------
+    def convert_folder_to_mobi(self, folder: Path, output_name: str, series_title: str, volume_index: int,
+                               device: str | None = None) -> bool:
+        """`device`: perfil de KCC del fan-out; la salida va a ebooks/<device>/."""
+        kcc_exe = self.resolve_kcc_exe()
+        output_dir = self.ebooks_dir / device if device else self.ebooks_dir
+        output_dir.mkdir(parents=True, exist_ok=True)
+
+        if not kcc_exe or not kcc_exe.exists():
+            self.log("❌ No se encontró KCC_c2e_*.exe en la carpeta del programa.")
+            return False
+
+        self.ensure_kindlegen_in_path()
+
+        imgs = list(folder.glob("*.jpg"))
+        if not imgs:
+            self.log(f"⚠ No hay imágenes JPG en {folder.name}; se omite conversión.")
+            return False
+
+        title = f"{series_title} - v{volume_index:02d}"
+        author = self.options.author.strip()
+
+        device = DEVICES.get(device or self.settings.device)
+        if device:
+            # las páginas ya tienen la geometría exacta del panel: KCC sólo empaqueta
+            cmd = [str(kcc_exe), "--manga-style", "--profile", device.key, "--noprocessing"]
+        else:
+            cmd = [str(kcc_exe), "--manga-style", "--profile", LEGACY_KCC_PROFILE, "--stretch", "--upscale"]
+        cmd += ["--format", "MOBI", "--title", title]
+        if author:
+            cmd += ["--author", author]
+        cmd += ["--output", str(output_dir), str(folder)]
+
+        self.log("KCC cmd: " + " ".join(f'"{c}"' if " " in c else c for c in cmd))
+        before = set(output_dir.iterdir())
+        try:
+            returncode, stdout, stderr = run_cancellable(
+                cmd, self.cancel_event, cwd=str(self.base_path), env=os.environ.copy()
+            )
+            if returncode is None:
+                # KCC/kindlegen interrumpidos: borrar lo que hubieran dejado a medias
+                for leftover in set(output_dir.iterdir()) - before:
+                    if leftover.is_dir():
+                        shutil.rmtree(leftover, ignore_errors=True)
+                    else:
+                        leftover.unlink(missing_ok=True)
+                self.log(f"⛔ KCC interrumpido en v{volume_index:02d}.")
+                return False
+            self.log(f"KCC stdout:\n{stdout.strip()}")
+            if returncode != 0:
+                self.log(f"KCC stderr:\n{stderr.strip()}")
+                self.log(f"❌ KCC terminó con código {returncode}.")
+                return False
+
+            mobis = list(output_dir.glob("*.mobi"))
+            if not mobis:
+                self.log("❌ No se detectó archivo MOBI generado.")
+                return False
+            mobi_file = max(mobis, key=lambda p: p.stat().st_mtime)
+
+            new_name = output_dir / f"{output_name}.mobi"
+            if new_name.exists() and not self.options.replace_existing:
+                ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+                new_name = output_dir / f"{output_name}_{ts}.mobi"
+            mobi_file.replace(new_name)
+            self.log(f"✅ MOBI: {new_name.name}")
+            return True
+        except Exception as e:
+            self.log(f"❌ Excepción al ejecutar KCC: {e}")
+            return False
+
+
+    # ---------------- KF8 nativo (AZW3) ----------------
+    def write_azw3(self, folder: Path, output_name: str, series_title: str, volume_index: int,
+                   device: str | None = None) -> bool:
+        """Empaqueta las páginas ya procesadas como AZW3 de maquetación fija sin KCC ni
+        kindlegen (ver kf8.py). Misma salida y nombres que convert_folder_to_mobi."""
+        import kf8      # sólo con --writer azw3: no cuenta en el arranque
+        output_dir = self.ebooks_dir / device if device else self.ebooks_dir
+        output_dir.mkdir(parents=True, exist_ok=True)
+        pages = sorted(folder.glob("*.jpg"))
+        if not pages:
+            self.log(f"⚠ No hay imágenes JPG en {folder.name}; se omite conversión.")
+            return False
+
+        profile = DEVICES.get(device or self.settings.device) or DEVICES[LEGACY_KCC_PROFILE]
+        meta = kf8.BookMeta(title=f"{series_title} - v{volume_index:02d}", author=self.options.author.strip(),
+                            series=series_title, volume=volume_index)
+        new_name = output_dir / f"{output_name}.azw3"
+        if new_name.exists() and not self.options.replace_existing:
+            ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+            new_name = output_dir / f"{output_name}_{ts}.azw3"
+        try:
+            t0 = time.perf_counter()
+            kf8.write_azw3(pages, new_name, meta, toc=self._volume_toc.get(device or "", []),
+                           viewport=(profile.width, profile.height))
+        except (OSError, ValueError) as e:
+            self.log(f"❌ No se pudo escribir {new_name.name}: {e}")
+            return False
+        self.log(f"✅ AZW3: {new_name.name} ({len(pages)} página(s), {time.perf_counter() - t0:.2f} s)")
+        return True
+
+
+# -------------------------- Modo vigilancia --------------------------
+class FolderWatcher:
+    """Sondea la carpeta fuente y convierte sólo los volúmenes afectados por capítulos
+    nuevos o modificados (el último volumen parcial y/o vNN nuevos).
+
+    Cada sondeo es un único scandir de la raíz comparando el mtime de cada carpeta de
+    capítulo; sólo se listan las carpetas cuyo mtime cambió. Un capítulo se da por
+    completo cuando su carpeta no cambia entre dos sondeos. El contenido de cada volumen
+    ya generado se guarda en `state_path` para saber qué hay que reempaquetar."""
+
+    def __init__(self, base_path: Path, folder: Path, profile: SourceProfile, subfolders: bool,
+                 group_size: int, settings: PipelineSettings, options: RunOptions, state_path: Path,
+                 cancel_event: threading.Event | None = None, log=print):
+        self.base_path = base_path
+        self.folder = folder
+        self.profile = profile
+        self.subfolders = subfolders
+        self.group_size = max(1, int(group_size))
+        self.settings = settings
+        self.options = replace(options, clean_ebooks_before=False, replace_existing=True)
+        self.state_path = state_path
+        self.cancel_event = cancel_event or threading.Event()
+        self.log = log
+        self._seen: dict[str, int] = {}                             # mtime del sondeo anterior
+        self._chapters: dict[str, tuple[int, Chapter | None]] = {}  # caché de listados
+        self._plan_key = [profile.key, self.group_size, self.options.start_volume]
+        self.volumes = self._load_state()                           # "NN" -> [[capítulo, mtime], ...]
+
+    def _load_state(self) -> dict[str, list]:
+        try:
+            state = json.loads(self.state_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return {}
+        if state.get("plan") != self._plan_key:
+            self.log("Modo vigilancia: cambió el perfil o la agrupación; se regenerarán todos los volúmenes.")
+            return {}
+        return state.get("volumes", {})
+
+    def _save_state(self):
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.state_path.with_suffix(".tmp")
+        tmp.write_text(json.dumps({"plan": self._plan_key, "volumes": self.volumes}, ensure_ascii=False),
+                       encoding="utf-8")
+        tmp.replace(self.state_path)
+
+    def _snapshot(self) -> dict[str, int]:
+        if self.profile.expects_subfolders and self.subfolders:
+            with os.scandir(self.folder) as it:
+                return {e.name: e.stat().st_mtime_ns for e in it if e.is_dir()}
+        return {self.folder.name: self.folder.stat().st_mtime_ns}
+
+    def _chapter(self, name: str, mtime: int) -> Chapter | None:
+        cached = self._chapters.get(name)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        d = self.folder / name if self.profile.expects_subfolders and self.subfolders else self.folder
+        with os.scandir(d) as it:
+            files = [Path(e.path) for e in it
+                     if e.is_file() and os.path.splitext(e.name)[1].lower() in IMAGE_FORMATS]
+        files.sort(key=self.profile.sort_image_key)
+        chapter = Chapter(name=name, dir=d, images=files) if files else None
+        self._chapters[name] = (mtime, chapter)
+        return chapter
+
+    def _recorded_mtimes(self) -> dict[str, int]:
+        return {name: mtime for vol in self.volumes.values() for name, mtime in vol}
+
+    def poll(self) -> list[int]:
+        """Un sondeo: convierte lo necesario y devuelve los volúmenes regenerados."""
+        snap = self._snapshot()
+        recorded = self._recorded_mtimes()
+        previous, self._seen = self._seen, snap
+
+        # capítulos estables en orden; el primero aún en escritura corta el plan para
+        # que los siguientes no se desplacen de volumen cuando termine de llegar
+        chapters, mtimes = [], {}
+        for name in sorted(snap, key=lambda n: self.profile.sort_chapter_key(self.folder / n)):
+            mtime = snap[name]
+            if previous.get(name) != mtime and recorded.get(name) != mtime:
+                break
+            chapter = self._chapter(name, mtime)
+            if chapter is not None:
+                chapters.append(chapter)
+                mtimes[name] = mtime
+        plan = plan_volumes(chapters, self.group_size)
+
+        start_v = max(1, int(self.options.start_volume))
+        wanted = {f"{start_v + i:02d}": [[c.name, mtimes[c.name]] for c in vol] for i, vol in enumerate(plan)}
+        affected = [i for i, key in enumerate(wanted) if self.volumes.get(key) != wanted[key]]
+        if not affected:
+            return []
+
+        # tramos consecutivos de volúmenes afectados: una conversión por tramo
+        runs, first = [], affected[0]
+        for prev, cur in zip(affected, affected[1:] + [None]):
+            if cur != prev + 1:
+                runs.append((first, prev + 1))
+                first = cur
+        done: list[int] = []
+        for a, b in runs:
+            if self.cancel_event.is_set():
+                break
+            self.log("Modo vigilancia: regenerando " + ", ".join(f"v{start_v + i:02d}" for i in range(a, b)))
+            options = replace(self.options, start_volume=start_v + a)
+            completed = Converter(self.base_path, self.settings, options,
+                                  cancel_event=self.cancel_event, log=self.log).run(plan[a:b])
+            for vnum in completed:
+                key = f"{vnum:02d}"
+                self.volumes[key] = wanted[key]
+            done += completed
+            self._save_state()
+        return done
+
+    def run_forever(self, interval: float):
+        self.log(f"Modo vigilancia: {self.folder} cada {interval:g} s (Ctrl+C para salir)")
+        while not self.cancel_event.is_set():
+            try:
+                self.poll()
+            except OSError as e:
+                # carpeta de red caída, capítulo borrado a mitad de sondeo...: reintentar
+                self.log(f"⚠ Modo vigilancia: {e}")
+            self.cancel_event.wait(interval)
+
+
+# -------------------------- Vista previa en segundo plano --------------------------
+PREVIEW_CACHE_SIZE = 12         # composiciones de vista previa retenidas (LRU)
+PREVIEW_PREFETCH_AHEAD = 2      # páginas siguientes que se preparan por adelantado
+PREVIEW_PREFETCH_BEHIND = 1     # páginas anteriores
+PREVIEW_PROXY_SIDE = 900        # alto de la composición Antes/Después (y de la vista proxy)
+PREVIEW_BAND_H = 36             # banda de títulos de la composición
+PREVIEW_CELL = (600, 800)       # celda del modo 2x2 (banda incluida)
+PREVIEW_DEBOUNCE_MS = 60        # espera tras mover un ajuste antes de regenerar la vista
+
+
+def _preview_box(mode: str) -> tuple[int, int]:
+    """Caja en la que la composición encaja cada imagen; la proxy se reduce justo a ella."""
+    if mode == "Antes/Después":
+        return 10**6, PREVIEW_PROXY_SIDE
+    return PREVIEW_CELL[0], PREVIEW_CELL[1] - PREVIEW_BAND_H
+
+
+def _contain(img: Image.Image, box: tuple[int, int]) -> Image.Image:
+    """La imagen si ya cabe en `box` (sin copia ni remuestreo); si no, una reducción LANCZOS."""
+    if img.width <= box[0] and img.height <= box[1]:
+        return img
+    img = img.copy()
+    img.thumbnail(box, Image.Resampling.LANCZOS)
+    return img
+
+
+@dataclass(frozen=True)
+class PreviewJob:
+    path: Path
+    mode: str                                   # "Antes/Después" | "2x2"
+    settings: tuple[PipelineSettings, ...]      # uno por preset mostrado
+    proxy: bool = False                         # cadena sobre una reducción al tamaño de pantalla
+
+
+class PreviewPrefetcher:
+    """Renderiza PreviewJobs en un hilo de fondo y guarda el resultado en una caché
+    LRU acotada. request() reemplaza la lista de trabajos pendientes (el primero es
+    el prioritario), así que navegar rápido no acumula trabajo obsoleto."""
+
+    def __init__(self, render, on_ready, capacity: int = PREVIEW_CACHE_SIZE):
+        self._render = render           # render(job) -> Image (se llama en el hilo de fondo)
+        self._on_ready = on_ready       # on_ready(job) (también desde el hilo de fondo)
+        self._capacity = capacity
+        self._cache: OrderedDict[PreviewJob, tuple] = OrderedDict()
+        self._wanted: list[PreviewJob] = []
+        self._cond = threading.Condition()
+        threading.Thread(target=self._loop, daemon=True).start()
+
+    def get(self, job: PreviewJob) -> tuple | None:
+        """(imagen, error) si el trabajo ya está hecho, o None."""
+        with self._cond:
+            if job in self._cache:
+                self._cache.move_to_end(job)
+                return self._cache[job]
+            return None
+
+    def request(self, jobs: list[PreviewJob]):
+        with self._cond:
+            self._wanted = [j for j in dict.fromkeys(jobs) if j not in self._cache]
+            self._cond.notify()
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while not self._wanted:
+                    self._cond.wait()
+                job = self._wanted.pop(0)
+            try:
+                result = (self._render(job), None)
+            except Exception as e:
+                result = (None, str(e))
+            with self._cond:
+                self._cache[job] = result
+                while len(self._cache) > self._capacity:
+                    self._cache.popitem(last=False)
+            self._on_ready(job)
+
+
 # -------------------------- App --------------------------
+UI_REFRESH_MS = 100         # cadencia fija de refresco de progreso/estado/log
+LOG_MAX_LINES = 5000        # el log de la UI conserva sólo las últimas N líneas
+LOG_MAX_MSG_LINES = 40      # mensajes más largos se recortan (p. ej. stdout de KCC)
+
+
 class KindleMangaOptimizer:
-    def __init__(self):
+    def __init__(self, startup_report: bool = False):
         self.root = tk.Tk()
         self.root.title("Kindle Manga Optimizer v5.0 (MOBI)")
         self.root.geometry("1180x880")
 
         # Config imagen (básicos)
         self.target_width = tk.IntVar(value=1200)
+        # Dispositivo: geometría exacta del panel (un solo reescalado; KCC no reprocesa)
+        self._device_choices = {"Libre (ancho objetivo; KCC reescala)": ""}
+        self._device_choices.update({f"{d.label} — {d.width}×{d.height} ({d.key})": d.key
+                                     for d in DEVICES.values()})
+        self.device_choice = tk.StringVar(
+            value=next(k for k, v in self._device_choices.items() if v == PipelineSettings.device))
+        self.fanout_devices = tk.StringVar(value="")  # fan-out: "KPW,KO,KS" (vacío = sólo el dispositivo)
         self.jpg_quality = tk.IntVar(value=84)
+        self.per_page_quality = tk.BooleanVar(value=False)  # buscar calidad por página
+        self.ssim_target = tk.DoubleVar(value=0.98)
         self.contrast_boost = tk.DoubleVar(value=1.15)
         self.sharpness_boost = tk.DoubleVar(value=1.2)
         self.noise_reduction = tk.BooleanVar(value=True)
         self.auto_contrast = tk.BooleanVar(value=True)
         self.to_grayscale = tk.BooleanVar(value=False)
         self.adaptive_threshold = tk.BooleanVar(value=False)  
+        self.adaptive_ops = tk.BooleanVar(value=True)   # análisis por página
 
         # Presets legibles
         self.preset_name = tk.StringVar(value="Manga limpio (rápido)")
         self.eink_dither = tk.BooleanVar(value=False)
+        self.binarizer = tk.StringVar(value="Sauvola")          # preset Texto pequeño B/N
+        self.binarize_fast = tk.BooleanVar(value=False)         # estadísticas a media resolución
+        self.strip_mode = tk.BooleanVar(value=False)    # webtoon: dividir tiras altas
+        self._blank_choices = {"Página mínima": "minimal", "Omitir": "drop", "Procesar normal": "off"}
+        self.blank_pages = tk.StringVar(value="Procesar normal")  # páginas en blanco/uniformes (opt-in)
+        self._writer_choices = {"MOBI (KCC + kindlegen)": "kcc", "AZW3 nativo (sin KCC)": "azw3"}
+        self.writer = tk.StringVar(value="MOBI (KCC + kindlegen)")  # empaquetado del volumen
 
         # Preview
         self.preview_mode = tk.StringVar(value="Antes/Después")  
+        self.preview_proxy = tk.BooleanVar(value=True)  # vista rápida + refinado a resolución completa
         self.comp_presets = [
             tk.StringVar(value="Manga limpio (rápido)"),
             tk.StringVar(value="Manga antiguo / bajo contraste"),
@@ -142,6 +1927,28 @@ class KindleMangaOptimizer:
         self._offset = [0, 0]          
         self._pan_start = None
 
+        # navegación de la vista previa + prefetch en segundo plano
+        self._preview_chapter = -1
+        self._preview_page = 0
+        self._preview_current: PreviewJob | None = None
+        self._preview_proxy_job: PreviewJob | None = None
+        self._preview_shown: PreviewJob | None = None
+        self._preview_refresh_id = None
+        # páginas decodificadas y ajustadas a la salida (+ análisis), compartidas por
+        # ambos hilos: al mover un ajuste sólo se repite la cadena sobre el proxy
+        self._preview_inputs: OrderedDict[tuple, tuple] = OrderedDict()
+        self._preview_inputs_lock = threading.Lock()
+        on_ready = lambda job: self.ui_queue.put(("preview", job))
+        self._prefetcher = PreviewPrefetcher(self._render_preview_job, on_ready=on_ready)
+        # hilo propio para el proxy: no espera detrás de un render a resolución completa
+        self._proxy_prefetcher = PreviewPrefetcher(self._render_preview_job, on_ready=on_ready)
+        for var in (self.contrast_boost, self.sharpness_boost, self.noise_reduction, self.auto_contrast,
+                    self.to_grayscale, self.adaptive_threshold, self.adaptive_ops, self.eink_dither,
+                    self.binarizer, self.binarize_fast,
+                    self.preset_name, self.target_width, self.device_choice, self.preview_mode,
+                    *self.comp_presets):
+            var.trace_add("write", lambda *_: self._schedule_preview_refresh())
+
         # estado de dibujo actual para invertir coordenadas (canvas -> imagen)
         self._draw_state = {
             "scale": 1.0,  
@@ -166,6 +1973,9 @@ class KindleMangaOptimizer:
         self.profile_key = tk.StringVar(value="INMANGA")
         self.clean_ebooks_before = tk.BooleanVar(value=True)
         self.clean_temp_before = tk.BooleanVar(value=True)
+        self.ram_stage_mb = tk.IntVar(value=RunOptions.ram_stage_mb)  # staging de volúmenes en RAM
+        self.workers = tk.IntVar(value=max(1, (os.cpu_count() or 2) - 1))  # procesos de páginas
+        self.page_budget_s = tk.IntVar(value=int(RunOptions.page_budget_s))  # 0 = sin límite por página
         self.start_volume = tk.IntVar(value=1)  # Volumen inicial
 
         # Metadatos / nombres
@@ -177,13 +1987,6 @@ class KindleMangaOptimizer:
             value=r"C:\Users\arturo.tzakum\AppData\Local\Amazon\Kindle Previewer 3"
         )
 
-        # Detectar ximgproc (Sauvola/Niblack)
-        try:
-            import cv2.ximgproc  # noqa
-            self.has_ximgproc = True
-        except Exception:
-            self.has_ximgproc = False
-
         self.base_path = Path.cwd()
         self.setup_directories()
 
@@ -193,38 +1996,61 @@ class KindleMangaOptimizer:
         # threading / cancel
         self.worker_thread: threading.Thread | None = None
         self.cancel_event = threading.Event()
-        self.ui_queue: "queue.Queue[str]" = queue.Queue()
+        self.ui_queue: "queue.Queue[tuple]" = queue.Queue()
+        self._log_buffer: deque[str] = deque(maxlen=LOG_MAX_LINES)
+
+        # Widgets de pestañas que se construyen bajo demanda (ver setup_ui)
+        self.chapter_list = None
+        self.preview_canvas = None
+        self.plan_tree = None
+        self.status_label = None
+        self.log_text = None
+
+        self.startup_report = startup_report
+        self.startup_ok = True
 
         self.setup_ui()
-        self.root.after(100, self._drain_ui_queue)
+        self.root.after(UI_REFRESH_MS, self._drain_ui_queue)
+        self.root.after_idle(self._on_first_idle)
 
     # ---------------- Directorios ----------------
     def setup_directories(self):
         for name in ['imagenes', 'procesadas', 'temp', 'ebooks']:
             (self.base_path / name).mkdir(exist_ok=True)
 
+    def _on_first_idle(self):
+        if self.startup_report:
+            # self.log sólo encola la línea (se vuelca en _drain_ui_queue, más tarde):
+            # la consola la recibe directamente antes de cerrar
+            self.startup_ok = report_startup("gui", lambda m: (print(m, flush=True), self.log(m)))
+            self.root.destroy()
+        else:
+            self.startup_ok = report_startup("gui", self.log)
+
     # ---------------- UI ----------------
     def setup_ui(self):
         main_frame = ttk.Frame(self.root)
         main_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
-        notebook = ttk.Notebook(main_frame)
-        notebook.pack(fill=tk.BOTH, expand=True)
-
-        config_frame = ttk.Frame(notebook)
-        notebook.add(config_frame, text="Configuración")
-        self.setup_config_tab(config_frame)
-
-        preview_frame = ttk.Frame(notebook)
-        notebook.add(preview_frame, text="Vista Previa / Capítulos")
-        self.setup_preview_tab(preview_frame)
-
-        plan_frame = ttk.Frame(notebook)
-        notebook.add(plan_frame, text="Plan de salida")
-        self.setup_plan_tab(plan_frame)
-
-        process_frame = ttk.Frame(notebook)
-        notebook.add(process_frame, text="Procesar")
-        self.setup_process_tab(process_frame)
+        self.notebook = ttk.Notebook(main_frame)
+        self.notebook.pack(fill=tk.BOTH, expand=True)
+
+        # Las pestañas se construyen la primera vez que se muestran
+        self._pending_tabs = {}
+        for text, builder in (("Configuración", self.setup_config_tab),
+                              ("Vista Previa / Capítulos", self.setup_preview_tab),
+                              ("Plan de salida", self.setup_plan_tab),
+                              ("Procesar", self.setup_process_tab)):
+            frame = ttk.Frame(self.notebook)
+            self.notebook.add(frame, text=text)
+            self._pending_tabs[str(frame)] = (frame, builder)
+        self.notebook.bind("<<NotebookTabChanged>>", self._build_selected_tab)
+        self._build_selected_tab()
+
+    def _build_selected_tab(self, event=None):
+        pending = self._pending_tabs.pop(self.notebook.select(), None)
+        if pending:
+            frame, builder = pending
+            builder(frame)
 
     def setup_config_tab(self, parent):
         # Origen
@@ -253,7 +2079,10 @@ class KindleMangaOptimizer:
         ttk.Entry(meta_frame, textvariable=self.series_title, width=40).grid(row=0, column=1, padx=6, pady=4)
         ttk.Label(meta_frame, text="Autor (opcional):").grid(row=1, column=0, sticky=tk.W, padx=6, pady=4)
         ttk.Entry(meta_frame, textvariable=self.author, width=40).grid(row=1, column=1, padx=6, pady=4)
-        ttk.Label(meta_frame, text="(El archivo será: 'Serie - vNN.mobi')").grid(row=2, column=0, columnspan=2, sticky=tk.W, padx=6)
+        ttk.Label(meta_frame, text="(El archivo será: 'Serie - vNN.mobi' o '.azw3')").grid(row=2, column=0, columnspan=2, sticky=tk.W, padx=6)
+        ttk.Label(meta_frame, text="Formato:").grid(row=3, column=0, sticky=tk.W, padx=6, pady=4)
+        ttk.Combobox(meta_frame, textvariable=self.writer, state="readonly", width=24,
+                     values=list(self._writer_choices.keys())).grid(row=3, column=1, padx=6, pady=4, sticky=tk.W)
 
         # Kindle Previewer 3
         kp_frame = ttk.LabelFrame(parent, text="Kindle Previewer 3 (para MOBI / KindleGen)")
@@ -268,16 +2097,32 @@ class KindleMangaOptimizer:
         ttk.Label(img_config, text="Ancho objetivo (px):").grid(row=0, column=0, sticky=tk.W, padx=4, pady=4)
         ttk.Spinbox(img_config, from_=800, to=2000, textvariable=self.target_width, width=10)\
             .grid(row=0, column=1, padx=4)
+        ttk.Label(img_config, text="Dispositivo:").grid(row=0, column=2, sticky=tk.W, padx=(16, 4))
+        ttk.Combobox(img_config, textvariable=self.device_choice, state="readonly", width=52,
+                     values=list(self._device_choices.keys())).grid(row=0, column=3, padx=4, sticky=tk.W)
         ttk.Label(img_config, text="Calidad JPG (%):").grid(row=1, column=0, sticky=tk.W, padx=4, pady=4)
         ttk.Spinbox(img_config, from_=50, to=100, textvariable=self.jpg_quality, width=10)\
             .grid(row=1, column=1, padx=4)
+        ttk.Checkbutton(img_config, text="Calidad por página (la calidad JPG pasa a ser el máximo) · SSIM objetivo:",
+                        variable=self.per_page_quality).grid(row=1, column=2, sticky=tk.W, padx=(16, 4))
+        ttk.Spinbox(img_config, from_=0.90, to=0.995, increment=0.005, textvariable=self.ssim_target, width=7)\
+            .grid(row=1, column=3, padx=4)
+        ttk.Checkbutton(img_config, text="Modo tira (webtoon): dividir imágenes muy altas en páginas",
+                        variable=self.strip_mode).grid(row=2, column=0, columnspan=2, sticky=tk.W, padx=4, pady=4)
+        ttk.Label(img_config, text="Fan-out (claves, p. ej. KPW,KO,KS):").grid(row=2, column=2, sticky=tk.W, padx=(16, 4))
+        ttk.Entry(img_config, textvariable=self.fanout_devices, width=24).grid(row=2, column=3, padx=4, sticky=tk.W)
+        ttk.Label(img_config, text="Páginas en blanco / uniformes:").grid(row=3, column=0, sticky=tk.W, padx=4, pady=4)
+        ttk.Combobox(img_config, textvariable=self.blank_pages, state="readonly", width=16,
+                     values=list(self._blank_choices.keys())).grid(row=3, column=1, padx=4, sticky=tk.W)
 
         visual_frame = ttk.LabelFrame(parent, text="Ajustes finos (se aplican tras el preset)")
         visual_frame.pack(fill=tk.X, padx=5, pady=5)
         ttk.Checkbutton(visual_frame, text="Auto-contraste (global)", variable=self.auto_contrast).pack(anchor=tk.W)
-        ttk.Checkbutton(visual_frame, text="Reducción de ruido básica (bilateral)", variable=self.noise_reduction).pack(anchor=tk.W)
+        ttk.Checkbutton(visual_frame, text="Reducción de ruido básica (preserva bordes)", variable=self.noise_reduction).pack(anchor=tk.W)
         ttk.Checkbutton(visual_frame, text="Escala de grises inicial", variable=self.to_grayscale).pack(anchor=tk.W)
         ttk.Checkbutton(visual_frame, text="(legacy) Umbral adaptativo", variable=self.adaptive_threshold).pack(anchor=tk.W)
+        ttk.Checkbutton(visual_frame, text="Análisis por página (omite filtros innecesarios)",
+                        variable=self.adaptive_ops).pack(anchor=tk.W)
         ttk.Label(visual_frame, text="Contraste global:").pack(anchor=tk.W)
         ttk.Scale(visual_frame, from_=0.5, to=2.0, variable=self.contrast_boost, orient=tk.HORIZONTAL).pack(fill=tk.X)
         ttk.Label(visual_frame, text="Nitidez global:").pack(anchor=tk.W)
@@ -299,6 +2144,11 @@ class KindleMangaOptimizer:
         ).grid(row=0, column=1, padx=6, pady=4)
         ttk.Checkbutton(presETF, text="Dither E-Ink (Floyd–Steinberg)", variable=self.eink_dither)\
             .grid(row=0, column=2, padx=12, pady=4)
+        ttk.Label(presETF, text="Binarizado B/N:").grid(row=1, column=0, sticky=tk.W, padx=6, pady=4)
+        ttk.Combobox(presETF, textvariable=self.binarizer, state="readonly", width=10,
+                     values=["Sauvola", "Wolf"]).grid(row=1, column=1, sticky=tk.W, padx=6, pady=4)
+        ttk.Checkbutton(presETF, text="Estadísticas a media resolución (más rápido)",
+                        variable=self.binarize_fast).grid(row=1, column=2, sticky=tk.W, padx=12, pady=4)
 
         # Agrupación
         grouping = ttk.LabelFrame(parent, text="Agrupación de capítulos")
@@ -318,6 +2168,9 @@ class KindleMangaOptimizer:
         ttk.Checkbutton(cleanf, text="Limpiar temp/", variable=self.clean_temp_before).pack(side=tk.LEFT, padx=6)
         ttk.Checkbutton(cleanf, text="Limpiar ebooks/ (salida)", variable=self.clean_ebooks_before)\
             .pack(side=tk.LEFT, padx=6)
+        ttk.Label(cleanf, text="Páginas en RAM (MB, 0 = disco):").pack(side=tk.LEFT, padx=(18, 4))
+        ttk.Spinbox(cleanf, from_=0, to=16384, increment=256, textvariable=self.ram_stage_mb, width=7)\
+            .pack(side=tk.LEFT)
 
     def setup_preview_tab(self, parent):
         # Left: lista de capítulos
@@ -350,6 +2203,18 @@ class KindleMangaOptimizer:
                      values=["Encajar (sin cortes)", "Zoom manual"]).pack(side=tk.LEFT, padx=4)
 
         ttk.Button(ctrl, text="Actualizar vista", command=self.render_preview_now).pack(side=tk.LEFT, padx=10)
+        ttk.Checkbutton(ctrl, text="Vista rápida (proxy)", variable=self.preview_proxy,
+                        command=self._schedule_preview_refresh).pack(side=tk.LEFT)
+
+        # Navegación por páginas / capítulos
+        navf = ttk.Frame(right)
+        navf.pack(fill=tk.X, pady=(0,6))
+        ttk.Button(navf, text="⏮ Cap.", command=lambda: self._preview_step(chapters=-1)).pack(side=tk.LEFT, padx=2)
+        ttk.Button(navf, text="◀ Pág.", command=lambda: self._preview_step(pages=-1)).pack(side=tk.LEFT, padx=2)
+        ttk.Button(navf, text="Pág. ▶", command=lambda: self._preview_step(pages=1)).pack(side=tk.LEFT, padx=2)
+        ttk.Button(navf, text="Cap. ⏭", command=lambda: self._preview_step(chapters=1)).pack(side=tk.LEFT, padx=2)
+        self.preview_pos_label = ttk.Label(navf, text="—")
+        self.preview_pos_label.pack(side=tk.LEFT, padx=10)
 
         # Controles de zoom
         zoomf = ttk.Frame(right)
@@ -402,11 +2267,16 @@ class KindleMangaOptimizer:
         self.preview_canvas.bind("<B1-Motion>", self._pan_drag_evt)
         self.preview_canvas.bind("<Motion>", self._on_mouse_move)
         self.preview_canvas.bind("<Leave>", lambda e: self._clear_magnifier())
+        # flechas izquierda/derecha = página anterior/siguiente (con el foco en el canvas)
+        self.preview_canvas.bind("<Enter>", lambda e: self.preview_canvas.focus_set())
+        self.preview_canvas.bind("<Left>", lambda e: self._preview_step(pages=-1))
+        self.preview_canvas.bind("<Right>", lambda e: self._preview_step(pages=1))
         # Mensaje inicial
         self.preview_canvas.create_text(
             10, 10, text="Selecciona un capítulo y pulsa 'Actualizar vista'.",
             anchor="nw", fill="#ddd", font=("Segoe UI", 11)
         )
+        self.refresh_chapter_list()
 
 
     def setup_plan_tab(self, parent):
@@ -418,8 +2288,12 @@ class KindleMangaOptimizer:
         self.plan_tree.column("#0", width=720, anchor=tk.W)
         self.plan_tree.column("pages", width=120, anchor=tk.CENTER)
         self.plan_tree.pack(fill=tk.BOTH, expand=True, padx=6, pady=6)
+        # los capítulos de cada volumen se insertan al desplegarlo
+        self.plan_tree.bind("<<TreeviewOpen>>", lambda e: self._fill_plan_volume(self.plan_tree.focus()))
         self.plan_summary = ttk.Label(parent, text="—")
         self.plan_summary.pack(anchor=tk.W, padx=6, pady=(0,8))
+        self._plan_rows = []
+        self.update_plan_view()
 
     def setup_process_tab(self, parent):
         info_frame = ttk.LabelFrame(parent, text="Estado del procesamiento")
@@ -438,6 +2312,12 @@ class KindleMangaOptimizer:
         self.btn_cancel = ttk.Button(button_frame, text="✖ Cancelar", command=self.cancel_process, state="disabled")
         self.btn_cancel.pack(side=tk.LEFT, padx=5)
         ttk.Button(button_frame, text="📚 Abrir carpeta MOBI", command=self.open_ebooks_folder).pack(side=tk.LEFT, padx=5)
+        ttk.Label(button_frame, text="Procesos en paralelo:").pack(side=tk.LEFT, padx=(16, 4))
+        ttk.Spinbox(button_frame, from_=1, to=max(1, os.cpu_count() or 1), textvariable=self.workers, width=5)\
+            .pack(side=tk.LEFT)
+        ttk.Label(button_frame, text="Máx. por página (s, 0 = sin límite):").pack(side=tk.LEFT, padx=(16, 4))
+        ttk.Spinbox(button_frame, from_=0, to=3600, increment=10, textvariable=self.page_budget_s, width=6)\
+            .pack(side=tk.LEFT)
 
         log_frame = ttk.LabelFrame(parent, text="Log de actividad")
         log_frame.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
@@ -446,23 +2326,76 @@ class KindleMangaOptimizer:
         self.log_text.configure(yscrollcommand=log_scrollbar.set)
         self.log_text.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         log_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        if self._log_buffer:
+            self.log_text.insert(tk.END, "\n".join(self._log_buffer) + "\n")
+            self.log_text.see(tk.END)
 
     # ---------------- Cola de mensajes (UI / hilos) ----------------
+    # Los hilos sólo encolan eventos; únicamente _drain_ui_queue (hilo de Tk) toca widgets.
+    #   ("log", [líneas]) | ("progress", "volumes"|"pages", maximum, value) | ("status", texto) | ("done",)
+    #   ("preview", PreviewJob) cuando el prefetcher termina una vista previa
     def _drain_ui_queue(self):
+        lines: deque[str] = deque(maxlen=LOG_MAX_LINES)
+        bars: dict[str, list] = {}
+        status = None
+        done = False
         while True:
             try:
-                msg = self.ui_queue.get_nowait()
+                kind, *payload = self.ui_queue.get_nowait()
             except queue.Empty:
                 break
-            self._log_ui(msg)
-        self.root.after(100, self._drain_ui_queue)
+            if kind == "log":
+                lines.extend(payload[0])
+            elif kind == "progress":
+                # se coalesce: sólo importa el último máximo/valor de cada barra
+                bar, maximum, value = payload
+                state = bars.setdefault(bar, [None, None])
+                if maximum is not None:
+                    state[0] = maximum
+                if value is not None:
+                    state[1] = value
+            elif kind == "status":
+                status = payload[0]
+            elif kind == "done":
+                done = True
+            elif kind == "preview":
+                self._on_preview_ready(payload[0])
+
+        if lines:
+            self._append_log(lines)
+        for kind, (maximum, value) in bars.items():
+            bar = self.progress if kind == "volumes" else self.progress_images
+            if maximum is not None:
+                bar['maximum'] = maximum
+            if value is not None:
+                bar['value'] = value
+        if status is not None:
+            self.status_label.config(text=status)
+        if done:
+            self.btn_convert.config(state="normal")
+            self.btn_cancel.config(state="disabled")
+        self.root.after(UI_REFRESH_MS, self._drain_ui_queue)
 
     def ui_log(self, message: str):
-        self.ui_queue.put(message)
-
-    def _log_ui(self, message: str):
         timestamp = datetime.now().strftime("%H:%M:%S")
-        self.log_text.insert(tk.END, f"[{timestamp}] {message}\n")
+        msg_lines = message.splitlines() or [""]
+        if len(msg_lines) > LOG_MAX_MSG_LINES:
+            # volcados largos (stdout de KCC): nos quedamos con el final
+            skipped = len(msg_lines) - LOG_MAX_MSG_LINES
+            msg_lines = [msg_lines[0], f"  … ({skipped} líneas omitidas)"] + msg_lines[-(LOG_MAX_MSG_LINES - 1):]
+        msg_lines[0] = f"[{timestamp}] {msg_lines[0]}"
+        self.ui_queue.put(("log", msg_lines))
+
+    def _append_log(self, lines):
+        # el buffer en anillo guarda el log aunque la pestaña Procesar no exista aún
+        self._log_buffer.extend(lines)
+        if self.log_text is None:
+            return
+        # una sola inserción por refresco y el widget nunca supera LOG_MAX_LINES
+        self.log_text.insert(tk.END, "\n".join(lines) + "\n")
+        excess = int(self.log_text.index("end-1c").split(".")[0]) - 1 - LOG_MAX_LINES
+        if excess > 0:
+            self.log_text.delete("1.0", f"{excess + 1}.0")
         self.log_text.see(tk.END)
 
     def log(self, message: str):
@@ -487,33 +2420,32 @@ class KindleMangaOptimizer:
         if not self.selected_folder:
             return
         profile = PROFILES[self.profile_key.get()]
-        formats = {'.jpg', '.jpeg', '.png', '.webp'}
-        if profile.expects_subfolders and self.process_subfolders.get():
-            subdirs = [d for d in self.selected_folder.iterdir() if d.is_dir()]
-            subdirs.sort(key=profile.sort_chapter_key)
-            for sub in subdirs:
-                files = [f for f in sub.iterdir() if f.is_file() and f.suffix.lower() in formats]
-                files.sort(key=profile.sort_image_key)
-                if files:
-                    self.chapters.append(Chapter(name=sub.name, dir=sub, images=files))
-        else:
-            files = [f for f in self.selected_folder.iterdir() if f.is_file() and f.suffix.lower() in formats]
-            files.sort(key=profile.sort_image_key)
-            if files:
-                self.chapters.append(Chapter(name=self.selected_folder.name, dir=self.selected_folder, images=files))
+        self.chapters = scan_chapters(self.selected_folder, profile, self.process_subfolders.get())
         self.refresh_chapter_list()
         self.update_plan_view()
         self.log(f"Escaneo completo: {len(self.chapters)} capítulo(s). Perfil={profile.key}")
 
-    def refresh_chapter_list(self):
-        self.chapter_list.delete(0, tk.END)
-        for ch in self.chapters:
-            tag = "✅" if ch.enabled else "❌"
-            self.chapter_list.insert(tk.END, f"{tag} {ch.name}  ({ch.pages} págs)")
+    @staticmethod
+    def _chapter_label(ch: Chapter) -> str:
+        tag = "✅" if ch.enabled else "❌"
+        return f"{tag} {ch.name}  ({ch.pages} págs)"
+
+    def refresh_chapter_list(self, rows: list[int] | None = None):
+        """Sin `rows` recarga la lista entera (una sola llamada a Tk); con `rows`
+        sólo reescribe esas filas (subir/bajar/incluir tocan una o dos)."""
+        if self.chapter_list is None:   # se rellenará al construir la pestaña
+            return
+        if rows is None:
+            self.chapter_list.delete(0, tk.END)
+            self.chapter_list.insert(tk.END, *map(self._chapter_label, self.chapters))
+            return
+        for i in rows:
+            self.chapter_list.delete(i)
+            self.chapter_list.insert(i, self._chapter_label(self.chapters[i]))
 
     def on_chapter_select(self, event=None):
-        # no renderizamos automáticamente; pedimos "Actualizar vista" para no bloquear
-        pass
+        # el render va al hilo de fondo, así que ya no bloquea la UI
+        self.render_preview_now()
 
     def move_chapter(self, delta: int):
         idxs = self.chapter_list.curselection()
@@ -523,8 +2455,9 @@ class KindleMangaOptimizer:
         j = i + delta
         if 0 <= j < len(self.chapters):
             self.chapters[i], self.chapters[j] = self.chapters[j], self.chapters[i]
-            self.refresh_chapter_list()
+            self.refresh_chapter_list([i, j])
             self.chapter_list.select_set(j)
+            self.chapter_list.see(j)
             self.update_plan_view()
 
     def toggle_chapter(self):
@@ -533,7 +2466,7 @@ class KindleMangaOptimizer:
             return
         i = idxs[0]
         self.chapters[i].enabled = not self.chapters[i].enabled
-        self.refresh_chapter_list()
+        self.refresh_chapter_list([i])
         self.chapter_list.select_set(i)
         self.update_plan_view()
 
@@ -544,37 +2477,170 @@ class KindleMangaOptimizer:
             self._preview_pil = None
             self._draw_canvas_message("Selecciona un capítulo en la lista.")
             return
-        ch = self.chapters[idxs[0]]
+        if idxs[0] != self._preview_chapter:
+            self._preview_chapter, self._preview_page = idxs[0], 0
+        self._show_preview_page()
+
+    def _preview_step(self, pages: int = 0, chapters: int = 0):
+        """Avanza/retrocede página (cruzando capítulos en los extremos) o capítulo."""
+        if not self.chapters:
+            return
+        c = min(max(0, self._preview_chapter), len(self.chapters) - 1)
+        p = self._preview_page
+        if chapters:
+            c = min(max(0, c + chapters), len(self.chapters) - 1)
+            p = 0
+        elif pages:
+            p += pages
+            if p >= self.chapters[c].pages and c + 1 < len(self.chapters):
+                c, p = c + 1, 0
+            elif p < 0 and c > 0:
+                c -= 1
+                p = self.chapters[c].pages - 1
+            p = min(max(0, p), max(0, self.chapters[c].pages - 1))
+        self._preview_chapter, self._preview_page = c, p
+        self.chapter_list.selection_clear(0, tk.END)
+        self.chapter_list.select_set(c)
+        self.chapter_list.see(c)
+        self._show_preview_page()
+
+    def _preview_job(self, path: Path) -> PreviewJob:
+        if self.preview_mode.get() == "Antes/Después":
+            presets = [self.preset_name.get()]
+        else:
+            presets = [v.get() for v in self.comp_presets[:3]]   # la rejilla muestra original + 3
+        return PreviewJob(path, self.preview_mode.get(), tuple(self.pipeline_settings(p) for p in presets))
+
+    def _preview_neighbours(self) -> list[Path]:
+        # páginas siguientes/anteriores en el orden de lectura, cruzando capítulos
+        flat = []
+        for offset in list(range(1, PREVIEW_PREFETCH_AHEAD + 1)) + \
+                      [-i for i in range(1, PREVIEW_PREFETCH_BEHIND + 1)]:
+            c, p = self._preview_chapter, self._preview_page + offset
+            while 0 <= c < len(self.chapters) and p >= self.chapters[c].pages:
+                p -= self.chapters[c].pages
+                c += 1
+            while c >= 0 and p < 0:
+                c -= 1
+                if c >= 0:
+                    p += self.chapters[c].pages
+            if 0 <= c < len(self.chapters) and 0 <= p < self.chapters[c].pages:
+                flat.append(self.chapters[c].images[p])
+        return flat
+
+    def _show_preview_page(self):
+        if not (0 <= self._preview_chapter < len(self.chapters)):
+            return
+        ch = self.chapters[self._preview_chapter]
         if not ch.images:
             self._preview_pil = None
             self._draw_canvas_message("Capítulo sin imágenes.")
             return
+        self._preview_page = min(self._preview_page, ch.pages - 1)   # tras reordenar/reescanear
+        path = ch.images[self._preview_page]
+        self.preview_pos_label.config(
+            text=f"Cap. {self._preview_chapter + 1}/{len(self.chapters)} · "
+                 f"Pág. {self._preview_page + 1}/{ch.pages} — {path.name}")
+
+        job = self._preview_job(path)
+        proxy = replace(job, proxy=True) if self.preview_proxy.get() else None
+        self._preview_current, self._preview_proxy_job = job, proxy
+        # el proxy se muestra enseguida; la versión completa lo sustituye al llegar
+        if proxy is not None:
+            self._proxy_prefetcher.request([proxy])
+        self._prefetcher.request([job] + [self._preview_job(p) for p in self._preview_neighbours()])
+        if self._prefetcher.get(job) is not None:
+            self._display_preview_job(job)
+        elif proxy is not None and self._proxy_prefetcher.get(proxy) is not None:
+            self._display_preview_job(proxy)
+        elif self._preview_shown is None or self._preview_shown.path != path:
+            self._preview_pil = None
+            self._draw_canvas_message(f"Procesando {path.name}...")
 
-        img_path = ch.images[0]
-        try:
-            orig = Image.open(img_path).convert("RGB")
-        except Exception as e:
+    def _schedule_preview_refresh(self):
+        # tras mover un ajuste: regenerar la página actual (agrupando cambios seguidos)
+        if self._preview_current is None or self.preview_canvas is None:
+            return
+        if self._preview_refresh_id is not None:
+            self.root.after_cancel(self._preview_refresh_id)
+        self._preview_refresh_id = self.root.after(PREVIEW_DEBOUNCE_MS, self._refresh_preview)
+
+    def _refresh_preview(self):
+        self._preview_refresh_id = None
+        self._show_preview_page()
+
+    def _on_preview_ready(self, job: PreviewJob):
+        if job == self._preview_current:
+            self._display_preview_job(job)
+        elif job == self._preview_proxy_job and self._prefetcher.get(self._preview_current) is None:
+            self._display_preview_job(job)
+
+    def _display_preview_job(self, job: PreviewJob):
+        prefetcher = self._proxy_prefetcher if job.proxy else self._prefetcher
+        composite, err = prefetcher.get(job) or (None, "sin resultado")
+        if err:
             self._preview_pil = None
-            self._draw_canvas_message(f"Error cargando imagen: {e}")
+            self._draw_canvas_message(f"Error cargando imagen: {err}")
             return
-
-        mode = self.preview_mode.get()
-        if mode == "Antes/Después":
-            proc = self.enhance_image_preset(orig, self.preset_name.get())
-            composite = self._compose_side_by_side(orig, proc, title_left="Original", title_right=self.preset_name.get())
-        else:
-            imgs = []
-            titles = []
-            for v in self.comp_presets:
-                p = v.get()
-                imgs.append(self.enhance_image_preset(orig, p))
-                titles.append(p)
-            composite = self._compose_grid_2x2(orig, imgs, titles)
-
+        if self._preview_shown is None or self._preview_shown.path != job.path:
+            self._offset = [0, 0]  # reset pan al cambiar de página (no al refinar)
+        self._preview_shown = job
         self._preview_pil = composite
-        self._offset = [0, 0]  # reset pan al generar nueva imagen
         self._redraw_preview()
 
+    def _preview_input(self, path: Path, st: PipelineSettings, proxy_box: tuple[int, int] | None):
+        """(original reducido, página ajustada a la salida, ajustes, análisis), cacheado por
+        página y geometría. En modo proxy la página se reduce justo a `proxy_box` (la caja
+        de la composición, que así ya no la remuestrea) y los ajustes llevan la escala
+        para los radios y bloques."""
+        key = (path, st.target_width, st.device, st.adaptive_ops)
+        # el candado cubre la decodificación: el hilo proxy y el completo comparten
+        # el trabajo en lugar de repetirlo a la vez
+        with self._preview_inputs_lock:
+            entry = self._preview_inputs.get(key)
+            if entry is None:
+                orig = Image.open(path).convert("RGB")
+                # como en process_page: análisis sobre la imagen decodificada, antes del ajuste
+                stats = _source_stats(orig, st)
+                # el lado procesado pasa por el mismo ajuste a la salida que process_page
+                page = _fit_for_output(orig, st)
+                orig.thumbnail((orig.width, PREVIEW_PROXY_SIDE), Image.Resampling.LANCZOS)   # sólo se muestra
+                entry = self._preview_inputs[key] = {"orig": orig, "page": page, "stats": stats}
+                while len(self._preview_inputs) > PREVIEW_CACHE_SIZE:
+                    self._preview_inputs.popitem(last=False)
+            self._preview_inputs.move_to_end(key)
+            page, scale = entry["page"], 1.0
+            if proxy_box is not None:
+                proxies = entry.setdefault("proxies", {})
+                if proxy_box not in proxies:
+                    bw, bh = proxy_box
+                    device = DEVICES.get(st.device)
+                    if device:
+                        # _finish_page encuadra al marco del dispositivo escalado, no al contenido
+                        scale = min(1.0, bw / device.width, bh / device.height)
+                    else:
+                        # _finish_page añade PAGE_PAD (escalado y redondeado) por lado: se le deja sitio
+                        pad = 2 * PAGE_PAD
+                        scale = min(1.0, (bw - 1) / (page.width + pad), (bh - 1) / (page.height + pad))
+                    if scale < 1.0:
+                        # redondeo a la baja: la proxy nunca supera la caja
+                        size = (max(1, int(page.width * scale)), max(1, int(page.height * scale)))
+                        page = page.resize(size, Image.Resampling.BILINEAR, reducing_gap=2.0)
+                    proxies[proxy_box] = (page, scale)
+                page, scale = proxies[proxy_box]
+        return entry["orig"], page, replace(st, preview_scale=scale), entry["stats"]
+
+    def _render_preview_job(self, job: PreviewJob) -> Image.Image:
+        # se ejecuta en el hilo de un PreviewPrefetcher: nada de Tk aquí
+        procs = []
+        for st in job.settings:
+            orig, page, st, stats = self._preview_input(job.path, st,
+                                                        _preview_box(job.mode) if job.proxy else None)
+            procs.append(enhance_image_preset(page, st, stats=stats))
+        if job.mode == "Antes/Después":
+            return self._compose_side_by_side(orig, procs[0], title_left="Original",
+                                              title_right=job.settings[0].preset)
+        return self._compose_grid_2x2(orig, procs, [st.preset for st in job.settings])
 
     def _draw_canvas_message(self, text):
         self.preview_canvas.delete("all")
@@ -666,6 +2732,8 @@ class KindleMangaOptimizer:
 
     def _clear_magnifier(self):
         # borra overlay de lupa (usamos una etiqueta/tag para borrado masivo)
+        if self.preview_canvas is None:
+            return
         self.preview_canvas.delete("magnifier")
         self._mag_photo = None
         self._mag_img_id = None
@@ -748,14 +2816,12 @@ class KindleMangaOptimizer:
 
     def _compose_side_by_side(self, left_img: Image.Image, right_img: Image.Image,
                               title_left="Original", title_right="Procesado") -> Image.Image:
-        # normaliza alturas
-        h = 900
-        l = left_img.copy()
-        r = right_img.copy()
-        l.thumbnail((9999, h), Image.Resampling.LANCZOS)
-        r.thumbnail((9999, h), Image.Resampling.LANCZOS)
+        # normaliza alturas (sin remuestrear lo que ya cabe, p. ej. la proxy)
+        h = PREVIEW_PROXY_SIDE
+        l = _contain(left_img, _preview_box("Antes/Después"))
+        r = _contain(right_img, _preview_box("Antes/Después"))
         w = l.width + r.width
-        band_h = 36
+        band_h = PREVIEW_BAND_H
         canvas = Image.new("RGB", (w, h + band_h), (30,30,30))
         # bandas y títulos
         draw = ImageDraw.Draw(canvas)
@@ -772,12 +2838,11 @@ class KindleMangaOptimizer:
         imgs = [orig] + procs[:3]
         titles = ["Original"] + titles[:3]
         # normaliza cada una
-        cell_w, cell_h = 600, 800
-        band_h = 36
+        cell_w, cell_h = PREVIEW_CELL
+        band_h = PREVIEW_BAND_H
         cells = []
         for im in imgs:
-            i2 = im.copy()
-            i2.thumbnail((cell_w, cell_h-band_h), Image.Resampling.LANCZOS)
+            i2 = _contain(im, _preview_box("2x2"))
             canvas = Image.new("RGB", (cell_w, cell_h), (30,30,30))
             draw = ImageDraw.Draw(canvas)
             draw.rectangle([(0,0),(cell_w,band_h)], fill=(50,50,50))
@@ -793,354 +2858,149 @@ class KindleMangaOptimizer:
             draw_g.text((cx+8, cy+8), titles[idx], fill=(255,255,255))
         return grid
 
-    # ---------------- Imagen: helpers pro ----------------
-    def _to_cv(self, img):
-        return cv2.cvtColor(np.array(img), cv2.COLOR_RGB2BGR)
-
-    def _from_cv(self, mat):
-        return Image.fromarray(cv2.cvtColor(mat, cv2.COLOR_BGR2RGB))
-
-    def _unsharp_mask(self, img_cv, radius=1.2, amount=0.7):
-        blur = cv2.GaussianBlur(img_cv, (0,0), radius)
-        return cv2.addWeighted(img_cv, 1+amount, blur, -amount, 0)
-
-    def _clahe_gray(self, img_cv, clip=2.0, tile=8):
-        gray = cv2.cvtColor(img_cv, cv2.COLOR_BGR2GRAY)
-        clahe = cv2.createCLAHE(clipLimit=clip, tileGridSize=(tile,tile))
-        g2 = clahe.apply(gray)
-        return cv2.cvtColor(g2, cv2.COLOR_GRAY2BGR)
-
-    def _nl_means(self, img_cv, strength=7):
-        try:
-            return cv2.fastNlMeansDenoisingColored(img_cv, None, strength, strength, 7, 21)
-        except Exception:
-            # fallback a bilateral si no está disponible
-            return cv2.bilateralFilter(img_cv, 9, 75, 75)
-
-    def _sauvola_like(self, img_cv):
-        gray = cv2.cvtColor(img_cv, cv2.COLOR_BGR2GRAY)
-        if self.has_ximgproc:
-            bin_ = cv2.ximgproc.niBlackThreshold(
-                gray, maxValue=255, type=cv2.THRESH_BINARY, blockSize=35, k=0.2
-            )
-        else:
-            bin_ = cv2.adaptiveThreshold(
-                gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 35, 10
-            )
-        return cv2.cvtColor(bin_, cv2.COLOR_GRAY2BGR)
-
-    def _auto_trim_and_pad(self, img_cv, pad_px=16):
-        gray = cv2.cvtColor(img_cv, cv2.COLOR_BGR2GRAY)
-        thr = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV+cv2.THRESH_OTSU)[1]
-        contours, _ = cv2.findContours(thr, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-        if not contours:
-            return img_cv
-        x,y,w,h = cv2.boundingRect(np.vstack(contours))
-        cropped = img_cv[y:y+h, x:x+w]
-        h_, w_ = cropped.shape[:2]
-        canvas = np.full((h_ + 2*pad_px, w_ + 2*pad_px, 3), 255, dtype=np.uint8)
-        canvas[pad_px:pad_px+h_, pad_px:pad_px+w_] = cropped
-        return canvas
-
-    def _apply_eink_dither(self, pil_img_rgb):
-        return pil_img_rgb.convert("P", palette=Image.ADAPTIVE, colors=256, dither=Image.FLOYDSTEINBERG).convert("RGB")
-
     # ---------------- Imagen: preset principal ----------------
-    def enhance_image_preset(self, img: Image.Image, preset: str) -> Image.Image:
-        # Paso 0: básicos previos (compatibilidad con tus toggles)
-        if self.to_grayscale.get():
-            img = ImageOps.grayscale(img).convert("RGB")
-        if self.auto_contrast.get():
-            img = ImageOps.autocontrast(img)
-        if self.noise_reduction.get():
-            try:
-                cv_tmp = self._to_cv(img)
-                cv_tmp = cv2.bilateralFilter(cv_tmp, 9, 75, 75)
-                img = self._from_cv(cv_tmp)
-            except Exception:
-                pass
-        if self.adaptive_threshold.get():
-            try:
-                cv_tmp = self._to_cv(img)
-                gray = cv2.cvtColor(cv_tmp, cv2.COLOR_BGR2GRAY)
-                thr = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
-                                            cv2.THRESH_BINARY, 35, 10)
-                img = Image.fromarray(thr).convert("RGB")
-            except Exception:
-                pass
-
-        img_cv = self._to_cv(img)
-
-        # Preset legible
-        p = preset.strip().lower()
-        if p.startswith("manga limpio"):
-            img_cv = self._clahe_gray(img_cv, clip=2.0, tile=8)
-            img_cv = self._unsharp_mask(img_cv, radius=1.0, amount=0.6)
-
-        elif p.startswith("manga antiguo"):
-            img_cv = self._clahe_gray(img_cv, clip=2.6, tile=8)
-            img_cv = self._unsharp_mask(img_cv, radius=1.0, amount=0.5)
-
-        elif p.startswith("escaneo con artefactos"):
-            img_cv = self._nl_means(img_cv, strength=6)
-            img_cv = self._unsharp_mask(img_cv, radius=1.2, amount=0.6)
-
-        elif p.startswith("texto pequeño"):
-            img_cv = self._sauvola_like(img_cv)
-
-        elif p.startswith("sólo recorte"):
-            pass  # se aplicará recorte/pad abajo
-
-        # Recorte + margen
-        img_cv = self._auto_trim_and_pad(img_cv, pad_px=16)
-
-        # Ajustes finos globales
-        img = self._from_cv(img_cv)
-        img = ImageEnhance.Contrast(img).enhance(self.contrast_boost.get())
-        img = ImageEnhance.Sharpness(img).enhance(self.sharpness_boost.get())
-
-        if self.eink_dither.get():
-            img = self._apply_eink_dither(img)
-
-        return img
-
-    # (compat) versión usada en procesamiento final con el preset actual
-    def enhance_image(self, img: Image.Image) -> Image.Image:
-        return self.enhance_image_preset(img, self.preset_name.get())
+    def pipeline_settings(self, preset: str | None = None) -> PipelineSettings:
+        # Instantánea de la UI; leer Tk sólo desde el hilo principal
+        return PipelineSettings(
+            preset=preset or self.preset_name.get(),
+            target_width=int(self.target_width.get()),
+            jpg_quality=int(self.jpg_quality.get()),
+            contrast_boost=float(self.contrast_boost.get()),
+            sharpness_boost=float(self.sharpness_boost.get()),
+            noise_reduction=self.noise_reduction.get(),
+            auto_contrast=self.auto_contrast.get(),
+            to_grayscale=self.to_grayscale.get(),
+            adaptive_threshold=self.adaptive_threshold.get(),
+            adaptive_ops=self.adaptive_ops.get(),
+            eink_dither=self.eink_dither.get(),
+            binarizer=self.binarizer.get().lower(),
+            binarize_stats_scale=0.5 if self.binarize_fast.get() else 1.0,
+            strip_mode=self.strip_mode.get(),
+            blank_pages=self._blank_choices.get(self.blank_pages.get(), "off"),
+            ssim_target=float(self.ssim_target.get()) if self.per_page_quality.get() else 0.0,
+            device=self._device_choices.get(self.device_choice.get(), ""),
+        )
 
-    # ---------------- Procesamiento de páginas ----------------
-    def process_single_image_seq(self, path: Path, dest: Path, seq_num: int) -> Path | None:
-        try:
-            img = Image.open(path).convert("RGB")
-            if img.width > self.target_width.get():
-                h = int(img.height * self.target_width.get() / img.width)
-                img = img.resize((self.target_width.get(), h), Image.Resampling.LANCZOS)
-            img = self.enhance_image(img)
-            out = dest / f"{seq_num:05d}.jpg"
-            img.save(
-                out, "JPEG",
-                quality=int(self.jpg_quality.get()),
-                optimize=True,
-                subsampling=0,      # 4:4:4
-                progressive=True
-            )
-            return out
-        except Exception as e:
-            self.log(f"Error procesando {path.name}: {e}")
-            return None
+    def enhance_image_preset(self, img: Image.Image, preset: str) -> Image.Image:
+        return enhance_image_preset(img, self.pipeline_settings(preset))
 
     # ---------------- Planificación ----------------
     def build_plan(self):
-        enabled = [c for c in self.chapters if c.enabled]
-        g = max(1, int(self.group_size.get()))
-        return [enabled[i:i+g] for i in range(0, len(enabled), g)]
+        return plan_volumes(self.chapters, self.group_size.get())
 
     def update_plan_view(self):
-        for i in self.plan_tree.get_children():
-            self.plan_tree.delete(i)
+        """Actualiza el árbol comparando con el plan anterior: sólo se reescriben los
+        volúmenes cuyo contenido cambió, y los capítulos de un volumen no se crean
+        hasta que se despliega (el árbol tiene una fila por volumen)."""
+        if self.plan_tree is None:   # se rellenará al construir la pestaña
+            return
         plan = self.build_plan()
-        total_vols = len(plan)
         total_pages = sum(ch.pages for vol in plan for ch in vol)
-
         start_v = max(1, int(self.start_volume.get()))
-        for idx, vol in enumerate(plan):
-            vnum = start_v + idx
-            vol_pages = sum(ch.pages for ch in vol)
-            vol_id = self.plan_tree.insert("", "end", text=f"Volumen {vnum:02d} (v{vnum:02d})", values=(vol_pages,))
-            for ch in vol:
-                tag = "✅" if ch.enabled else "❌"
-                self.plan_tree.insert(vol_id, "end", text=f"  {tag} {ch.name}", values=(ch.pages,))
-        self.plan_summary.config(text=f"Volúmenes: {total_vols}   Páginas totales: {total_pages}")
+        rows = [(start_v + idx, tuple((ch.name, ch.pages) for ch in vol)) for idx, vol in enumerate(plan)]
+
+        tree = self.plan_tree
+        for idx in range(len(rows), len(self._plan_rows)):       # volúmenes que sobran
+            tree.delete(f"v{idx}")
+        for idx, row in enumerate(rows):
+            if idx < len(self._plan_rows) and self._plan_rows[idx] == row:
+                continue
+            vnum, chapters = row
+            iid = f"v{idx}"
+            text = f"Volumen {vnum:02d} (v{vnum:02d})"
+            values = (sum(pages for _, pages in chapters),)
+            if tree.exists(iid):
+                tree.item(iid, text=text, values=values)
+                if tree.item(iid, "open"):
+                    self._fill_plan_volume(iid, chapters)
+                elif tree.get_children(iid) != ("…" + iid,):
+                    self._fold_plan_volume(iid)
+            else:
+                tree.insert("", "end", iid=iid, text=text, values=values)
+                tree.insert(iid, "end", iid="…" + iid, text="…")   # marcador: se puede desplegar
+        self._plan_rows = rows
+        self.plan_summary.config(text=f"Volúmenes: {len(rows)}   Páginas totales: {total_pages}")
+
+    def _fold_plan_volume(self, iid: str):
+        # volumen cerrado con capítulos obsoletos: volver al marcador
+        tree = self.plan_tree
+        tree.delete(*tree.get_children(iid))
+        tree.insert(iid, "end", iid="…" + iid, text="…")
+
+    def _fill_plan_volume(self, iid: str, chapters: tuple | None = None):
+        if not iid.startswith("v") or "." in iid:    # capítulo o marcador
+            return
+        if chapters is None:
+            chapters = self._plan_rows[int(iid[1:])][1]
+        tree = self.plan_tree
+        if tree.get_children(iid):
+            tree.delete(*tree.get_children(iid))
+        for k, (name, pages) in enumerate(chapters):
+            # en el plan sólo hay capítulos habilitados
+            tree.insert(iid, "end", iid=f"{iid}.{k}", text=f"  ✅ {name}", values=(pages,))
 
     # ---------------- Conversión (hilo) ----------------
     def start_process_thread(self):
         if self.worker_thread and self.worker_thread.is_alive():
             return
+        if not self.selected_folder:
+            self.log("⚠ Selecciona primero una carpeta.")
+            return
+        plan = self.build_plan()
+        if not plan:
+            self.log("⚠ No hay capítulos habilitados.")
+            return
+        try:
+            devices = parse_devices(self.fanout_devices.get())
+        except ValueError as e:
+            self.log(f"⚠ Fan-out: {e}")
+            return
+        # Todo lo que el hilo necesita de Tk se lee aquí, en el hilo principal
+        settings = self.pipeline_settings()
+        if devices:
+            settings = replace(settings, device=devices[0])
+        options = RunOptions(
+            series=self.series_title.get().strip() or self.selected_folder.name,
+            author=self.author.get().strip(),
+            start_volume=max(1, int(self.start_volume.get())),
+            workers=max(1, int(self.workers.get())),
+            clean_temp_before=self.clean_temp_before.get(),
+            clean_ebooks_before=self.clean_ebooks_before.get(),
+            kp3_dir=self.kp3_dir.get(),
+            ram_stage_mb=max(0, int(self.ram_stage_mb.get())),
+            devices=devices if len(devices) > 1 else (),
+            page_budget_s=max(0, int(self.page_budget_s.get())),
+            writer=self._writer_choices.get(self.writer.get(), "kcc"),
+        )
         self.cancel_event.clear()
         self.btn_convert.config(state="disabled")
         self.btn_cancel.config(state="normal")
-        self.worker_thread = threading.Thread(target=self._process_plan_worker, daemon=True)
+        self.worker_thread = threading.Thread(target=self._process_plan_worker,
+                                              args=(plan, settings, options), daemon=True)
         self.worker_thread.start()
 
     def cancel_process(self):
         self.cancel_event.set()
-        self.log("⚠ Cancelando... (se detendrá al finalizar el paso en curso)")
+        self.log("⚠ Cancelando... (interrumpiendo páginas y KCC en curso)")
 
-    def _process_plan_worker(self):
+    def _process_plan_worker(self, plan, settings: PipelineSettings, options: RunOptions):
         try:
-            if not self.selected_folder:
-                self.log("⚠ Selecciona primero una carpeta.")
-                return
-            plan = self.build_plan()
-            if not plan:
-                self.log("⚠ No hay capítulos habilitados.")
-                return
-
-            temp_dir = self.base_path / 'temp'
-            ebooks_dir = self.base_path / 'ebooks'
-
-            if self.clean_temp_before.get():
-                shutil.rmtree(temp_dir, ignore_errors=True)
-            temp_dir.mkdir(parents=True, exist_ok=True)
-
-            if self.clean_ebooks_before.get():
-                shutil.rmtree(ebooks_dir, ignore_errors=True)
-            ebooks_dir.mkdir(parents=True, exist_ok=True)
-
-            series = self.series_title.get().strip() or (self.selected_folder.name if self.selected_folder else "Manga")
-            total_vols = len(plan)
-            self.log(f"Inicio de conversión: {total_vols} volúmen(es). Serie: {series}")
-
-            self._set_progress(self.progress, maximum=total_vols, value=0)
-            created = 0
-
-            start_v = max(1, int(self.start_volume.get()))
-            for idx, vol in enumerate(plan):
-                if self.cancel_event.is_set():
-                    self.log("⛔ Proceso cancelado por el usuario.")
-                    break
-
-                vnum = start_v + idx
-                vol_tmp = temp_dir / f"vol_{vnum:02d}"
-                shutil.rmtree(vol_tmp, ignore_errors=True)
-                vol_tmp.mkdir(parents=True, exist_ok=True)
-
-                total_imgs = sum(len(ch.images) for ch in vol)
-                self._set_progress(self.progress_images, maximum=max(1, total_imgs), value=0)
-                seq = 1
-                for ch in vol:
-                    for img in ch.images:
-                        if self.cancel_event.is_set():
-                            break
-                        self.process_single_image_seq(img, vol_tmp, seq_num=seq)
-                        seq += 1
-                        self._set_progress(self.progress_images, value=seq-1)
-                    if self.cancel_event.is_set():
-                        break
-
-                if self.cancel_event.is_set():
-                    self.log("⛔ Proceso cancelado tras exportar imágenes.")
-                    break
-
-                out_name = f"{series} - v{vnum:02d}"
-                ok = self.convert_folder_to_mobi(vol_tmp, out_name, series_title=series, volume_index=vnum)
-                if ok:
-                    created += 1
-                else:
-                    self.log(f"❌ Falló conversión del volumen v{vnum:02d} (continuando con el siguiente).")
-
-                self._set_progress(self.progress, value=idx + 1)
-
-            self.log(f"✅ Proceso finalizado. {created} archivo(s) MOBI generados.")
+            converter = Converter(
+                self.base_path, settings, options, cancel_event=self.cancel_event, log=self.log,
+                progress=lambda kind, maximum=None, value=None: self._set_progress(kind, maximum, value),
+                status=self._set_status,
+            )
+            converter.run(plan)
         finally:
-            self.btn_convert.config(state="normal")
-            self.btn_cancel.config(state="disabled")
             self._set_status("Listo.")
+            self.ui_queue.put(("done",))
 
-    def _set_progress(self, bar: ttk.Progressbar, maximum: int | None = None, value: int | None = None):
-        if maximum is not None:
-            bar['maximum'] = maximum
-        if value is not None:
-            bar['value'] = value
-        self.root.update_idletasks()
+    def _set_progress(self, kind: str, maximum: int | None = None, value: int | None = None):
+        # kind: "volumes" | "pages" (ver _drain_ui_queue)
+        self.ui_queue.put(("progress", kind, maximum, value))
 
     def _set_status(self, text: str):
-        self.status_label.config(text=text)
-        self.root.update_idletasks()
-
-    # ---------------- Localización de KCC / KindleGen ----------------
-    def resolve_kcc_exe(self) -> Path | None:
-        candidates = sorted(self.base_path.glob("KCC_c2e_*.exe"))
-        if not candidates:
-            return None
-        return candidates[-1]
-
-    def ensure_kindlegen_in_path(self) -> Path | None:
-        local_kg = self.base_path / "kindlegen.exe"
-        if local_kg.exists():
-            self.log(f"kindlegen.exe encontrado localmente: {local_kg}")
-            return local_kg
-
-        previewer_root = Path(self.kp3_dir.get().strip('"'))
-        if previewer_root.exists():
-            self.log(f"Buscando kindlegen.exe dentro de: {previewer_root}")
-            matches = list(previewer_root.rglob("kindlegen.exe"))
-            if matches:
-                kg = matches[0]
-                kg_dir = str(kg.parent)
-                os.environ["PATH"] = kg_dir + os.pathsep + os.environ.get("PATH", "")
-                self.log(f"kindlegen.exe encontrado: {kg} (añadido al PATH)")
-                return kg
-
-        self.log("⚠ No se encontró kindlegen.exe. KCC podría fallar con 'KindleGen is missing!'")
-        return None
-
-    # ---------------- KCC (MOBI) ----------------
-    def convert_folder_to_mobi(self, folder: Path, output_name: str, series_title: str, volume_index: int) -> bool:
-        kcc_exe = self.resolve_kcc_exe()
-        output_dir = self.base_path / 'ebooks'
-        output_dir.mkdir(exist_ok=True)
-
-        if not kcc_exe or not kcc_exe.exists():
-            self.log("❌ No se encontró KCC_c2e_*.exe en la carpeta del programa.")
-            return False
-
-        self.ensure_kindlegen_in_path()
-
-        imgs = list(folder.glob("*.jpg"))
-        if not imgs:
-            self.log(f"⚠ No hay imágenes JPG en {folder.name}; se omite conversión.")
-            return False
-
-        title = f"{series_title} - v{volume_index:02d}"
-        author = self.author.get().strip()
-
-        cmd = [
-            str(kcc_exe),
-            "--manga-style",
-            "--profile", "KPW",
-            "--stretch",
-            "--upscale",
-            "--format", "MOBI",
-            "--title", title
-        ]
-        if author:
-            cmd += ["--author", author]
-        cmd += ["--output", str(output_dir), str(folder)]
-
-        self.log("KCC cmd: " + " ".join(f'"{c}"' if " " in c else c for c in cmd))
-        try:
-            res = subprocess.run(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                shell=False,
-                cwd=str(self.base_path),
-                env=os.environ.copy()
-            )
-            self.log(f"KCC stdout:\n{res.stdout.strip()}")
-            if res.returncode != 0:
-                self.log(f"KCC stderr:\n{res.stderr.strip()}")
-                self.log(f"❌ KCC terminó con código {res.returncode}.")
-                return False
-
-            mobis = list(output_dir.glob("*.mobi"))
-            if not mobis:
-                self.log("❌ No se detectó archivo MOBI generado.")
-                return False
-            mobi_file = max(mobis, key=lambda p: p.stat().st_mtime)
-
-            new_name = output_dir / f"{output_name}.mobi"
-            if new_name.exists():
-                ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-                new_name = output_dir / f"{output_name}_{ts}.mobi"
-            mobi_file.rename(new_name)
-            self.log(f"✅ MOBI: {new_name.name}")
-            return True
-        except Exception as e:
-            self.log(f"❌ Excepción al ejecutar KCC: {e}")
-            return False
+        self.ui_queue.put(("status", text))
 
     # ---------------- Utilidades ----------------
     def open_ebooks_folder(self):
@@ -1154,16 +3014,133 @@ class KindleMangaOptimizer:
         self.root.mainloop()
 
 
-def main():
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Kindle Manga Optimizer")
+    parser.add_argument("--headless", metavar="CARPETA",
+                        help="convertir CARPETA sin interfaz gráfica")
+    parser.add_argument("--profile", choices=list(PROFILES.keys()), default="INMANGA")
+    parser.add_argument("--no-subfolders", action="store_true",
+                        help="no tratar las subcarpetas como capítulos")
+    parser.add_argument("--preset", default=PipelineSettings.preset)
+    parser.add_argument("--device", choices=list(DEVICES.keys()) + ["libre"], default=PipelineSettings.device,
+                        help="geometría exacta del panel ('libre' = ancho --width y KCC reescala)")
+    parser.add_argument("--devices", default="", metavar="CLAVES",
+                        help="fan-out: varias claves separadas por comas (p. ej. KPW,KO,KS); cada página "
+                             "se filtra una vez y se genera un MOBI por dispositivo en ebooks/<clave>/")
+    parser.add_argument("--writer", choices=["kcc", "azw3"], default=RunOptions.writer,
+                        help="empaquetado: 'kcc' (KCC + kindlegen, MOBI) o 'azw3' (escritor KF8 nativo, "
+                             "sin KCC ni kindlegen)")
+    parser.add_argument("--width", type=int, default=PipelineSettings.target_width)
+    parser.add_argument("--quality", type=int, default=PipelineSettings.jpg_quality,
+                        help="calidad JPG (máxima, si se usa --ssim-target)")
+    parser.add_argument("--ssim-target", type=float, default=0.0, metavar="SSIM",
+                        help="calidad JPG por página: la menor que alcance este SSIM (p. ej. 0.98)")
+    parser.add_argument("--binarizer", choices=["sauvola", "wolf"], default=PipelineSettings.binarizer,
+                        help="binarización del preset 'Texto pequeño B/N'")
+    parser.add_argument("--binarize-scale", type=float, default=1.0, metavar="ESCALA",
+                        help="calcular las estadísticas locales del binarizado a esta escala (p. ej. 0.5)")
+    parser.add_argument("--denoise", choices=["fast", "bilateral"], default=PipelineSettings.denoise,
+                        help="reducción de ruido básica: 'fast' (luminancia, ventana 5) o el bilateral 9×9 clásico")
+    parser.add_argument("--blank-pages", choices=["minimal", "drop", "off"], default=PipelineSettings.blank_pages,
+                        help="páginas en blanco/uniformes: página mínima precalculada, omitirlas, "
+                             "o pasarlas por la cadena completa (por defecto; las casi vacías con poco "
+                             "dibujo también cuentan como uniformes)")
+    parser.add_argument("--strip", action="store_true",
+                        help="modo tira (webtoon): dividir imágenes muy altas en páginas")
+    parser.add_argument("--group-size", type=int, default=10)
+    parser.add_argument("--start-volume", type=int, default=1)
+    parser.add_argument("--series", default="")
+    parser.add_argument("--author", default="")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) - 1))
+    parser.add_argument("--kp3-dir", default="")
+    parser.add_argument("--keep-temp", action="store_true", help="no limpiar temp/ antes de convertir")
+    parser.add_argument("--keep-ebooks", action="store_true", help="no limpiar ebooks/ antes de convertir")
+    parser.add_argument("--ram-mb", type=int, default=RunOptions.ram_stage_mb,
+                        help="presupuesto para preparar los volúmenes en RAM (0 = siempre en disco)")
+    parser.add_argument("--ram-dir", default="",
+                        help="tmpfs/ramdisk para el staging (por defecto /dev/shm si existe)")
+    parser.add_argument("--page-budget", type=float, default=RunOptions.page_budget_s, metavar="SEG",
+                        help="tiempo máximo por página; si lo excede se repite con una cadena más barata (0 = sin límite)")
+    parser.add_argument("--page-mem-mb", type=int, default=RunOptions.page_mem_mb,
+                        help="memoria estimada máxima por página antes de pasar a la cadena barata (0 = sin límite)")
+    parser.add_argument("--watch", type=float, default=0, metavar="SEG",
+                        help="con --headless: vigilar la carpeta cada SEG segundos y convertir sólo "
+                             "los volúmenes con capítulos nuevos")
+    parser.add_argument("--startup-report", action="store_true",
+                        help="medir el arranque en frío, informar y salir (código 1 si excede el presupuesto)")
+    return parser.parse_args(argv)
+
+
+def _console_log(message: str):
+    print(f"[{datetime.now().strftime('%H:%M:%S')}] {message}", flush=True)
+
+
+def run_headless(args) -> int:
+    folder = Path(args.headless)
+    if not folder.is_dir():
+        _console_log(f"⚠ No existe la carpeta: {folder}")
+        return 1
     try:
-        import cv2  # noqa
-        from PIL import Image  # noqa
-    except ImportError as e:
-        print(f"Falta dependencia: {e}")
-        return
-    app = KindleMangaOptimizer()
+        devices = parse_devices(args.devices)
+    except ValueError as e:
+        _console_log(f"⚠ --devices: {e}")
+        return 1
+    # antes de escanear: el presupuesto mide el arranque, no el tamaño de la biblioteca
+    startup_ok = report_startup("headless", _console_log)
+    if args.startup_report:
+        return 0 if startup_ok else 1
+    settings = PipelineSettings(preset=args.preset, target_width=args.width, jpg_quality=args.quality,
+                                strip_mode=args.strip, ssim_target=args.ssim_target,
+                                binarizer=args.binarizer, denoise=args.denoise, blank_pages=args.blank_pages,
+                                binarize_stats_scale=min(1.0, max(0.1, args.binarize_scale)),
+                                device=devices[0] if devices else ("" if args.device == "libre" else args.device))
+    options = RunOptions(
+        series=args.series.strip() or folder.name,
+        author=args.author,
+        start_volume=max(1, args.start_volume),
+        workers=max(1, args.workers),
+        clean_temp_before=not args.keep_temp,
+        clean_ebooks_before=not args.keep_ebooks,
+        kp3_dir=args.kp3_dir,
+        ram_stage_mb=max(0, args.ram_mb),
+        ram_stage_dir=args.ram_dir,
+        devices=devices if len(devices) > 1 else (),
+        page_budget_s=max(0.0, args.page_budget),
+        page_mem_mb=max(0, args.page_mem_mb),
+        writer=args.writer,
+    )
+    cancel_event = threading.Event()
+    signal.signal(signal.SIGINT, lambda *_: cancel_event.set())   # Ctrl+C = Cancelar
+    if args.watch > 0:
+        state_path = Path.cwd() / 'ebooks' / f"{options.series}.watch.json"
+        FolderWatcher(Path.cwd(), folder, PROFILES[args.profile], not args.no_subfolders, args.group_size,
+                      settings, options, state_path, cancel_event=cancel_event,
+                      log=_console_log).run_forever(args.watch)
+        return 0
+    chapters = scan_chapters(folder, PROFILES[args.profile], subfolders=not args.no_subfolders)
+    plan = plan_volumes(chapters, args.group_size)
+    if not plan:
+        _console_log("⚠ No hay capítulos habilitados.")
+        return 1
+
+    completed = Converter(Path.cwd(), settings, options, cancel_event=cancel_event,
+                          log=_console_log).run(plan)
+    return 0 if len(completed) == len(plan) else 1
+
+
+def main(argv=None) -> int:
+    multiprocessing.freeze_support()   # requerido por el pool en el .exe de PyInstaller
+    args = parse_args(argv)
+    missing = missing_dependencies()
+    if missing:
+        print(f"Falta dependencia: {', '.join(missing)}")
+        return 1
+    if args.headless:
+        return run_headless(args)
+    app = KindleMangaOptimizer(startup_report=args.startup_report)
     app.run()
+    return 0 if app.startup_ok else 1
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
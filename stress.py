@@ -0,0 +1,224 @@
+"""
+Banco de pruebas de bibliotecas grandes: rutas estructurales (escaneo, orden, plan y vistas).
+
+- Genera árboles sintéticos estilo TMO ("Capítulo 001 - Título/001.png") o INMANGA
+  ("Chapter 1/001.jpg") con imágenes mínimas, hasta miles de capítulos y 200k archivos.
+- Mide scan_chapters, las claves de orden de SourceProfile, plan_volumes y, si hay
+  display, refresh_chapter_list/update_plan_view (carga completa y un "subir capítulo").
+- Informa de cómo escala cada etapa: µs por capítulo/archivo y exponente k (t ~ n^k)
+  entre la escala menor y la mayor.
+
+Uso:
+    py -3.13 stress.py --profile TMO --scales 100,1000,5000 --pages 40
+    py -3.13 stress.py --profile INMANGA --scales 500,5000 --no-ui --json informe.json
+"""
+from __future__ import annotations
+
+import io
+import sys
+import json
+import math
+import time
+import random
+import shutil
+import argparse
+import tempfile
+from pathlib import Path
+
+import main as kmo
+
+
+DEFAULT_SCALES = (100, 500, 1000, 5000)     # capítulos
+DEFAULT_PAGES = 40                           # 5000 × 40 = 200k archivos
+EXTRA_EVERY = 97            # cada N capítulos, uno sin número ("Extra"): rama de respaldo del orden
+MARKER = ".stress.json"     # parámetros del árbol generado (se reutiliza si coinciden)
+
+
+# -------------------------- Generación --------------------------
+def _placeholder(suffix: str) -> bytes:
+    buf = io.BytesIO()
+    kmo.Image.new("L", (1, 1), 255).save(buf, "PNG" if suffix == ".png" else "JPEG")
+    return buf.getvalue()
+
+
+def _names(profile: str, chapters: int, pages: int, seed: int) -> list[tuple[str, list[str]]]:
+    """(carpeta, archivos) en orden aleatorio, como los devuelve un sistema de archivos
+    cualquiera: el orden correcto lo tiene que reconstruir el perfil."""
+    rng = random.Random(seed)
+    tree = []
+    for n in range(1, chapters + 1):
+        if n % EXTRA_EVERY == 0:
+            folder = f"Extra {n // EXTRA_EVERY}"
+        elif profile == "TMO":
+            folder = f"Capítulo {n:03d} - Título {rng.randrange(10**6)}"
+        else:
+            folder = f"Chapter {n}"
+        ext = ".png" if profile == "TMO" else ".jpg"
+        files = [f"{p:03d}{ext}" for p in range(1, pages + 1)]
+        rng.shuffle(files)
+        tree.append((folder, files))
+    rng.shuffle(tree)
+    return tree
+
+
+def generate_library(root: Path, profile: str, chapters: int, pages: int, seed: int = 0) -> int:
+    """Crea (o reutiliza) el árbol sintético en `root`. Devuelve el número de archivos."""
+    params = {"profile": profile, "chapters": chapters, "pages": pages, "seed": seed}
+    marker = root / MARKER
+    if marker.exists() and json.loads(marker.read_text(encoding="utf-8")) == params:
+        return chapters * pages
+    shutil.rmtree(root, ignore_errors=True)
+    root.mkdir(parents=True)
+    data = _placeholder(".png" if profile == "TMO" else ".jpg")
+    for folder, files in _names(profile, chapters, pages, seed):
+        d = root / folder
+        d.mkdir()
+        for name in files:
+            with open(d / name, "wb") as f:
+                f.write(data)
+    marker.write_text(json.dumps(params), encoding="utf-8")
+    return chapters * pages
+
+
+# -------------------------- Medición --------------------------
+def _timed(fn, *args, repeat: int = 1):
+    """(mejor tiempo en s, resultado de la última llamada)."""
+    best, result = math.inf, None
+    for _ in range(max(1, repeat)):
+        t0 = time.perf_counter()
+        result = fn(*args)
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+
+def measure_core(root: Path, profile: kmo.SourceProfile, group_size: int, repeat: int) -> dict[str, float]:
+    t_scan, chapters = _timed(kmo.scan_chapters, root, profile, True, repeat=repeat)
+    dirs = [ch.dir for ch in chapters]
+    t_sort_ch, _ = _timed(lambda: sorted(dirs, key=profile.sort_chapter_key), repeat=repeat)
+    # como scan_chapters: cada capítulo ordena sólo sus imágenes
+    t_sort_img, _ = _timed(lambda: [sorted(ch.images, key=profile.sort_image_key) for ch in chapters],
+                           repeat=repeat)
+    t_plan, _ = _timed(kmo.plan_volumes, chapters, group_size, repeat=repeat)
+    return {"escaneo": t_scan, "orden_caps": t_sort_ch, "orden_imgs": t_sort_img, "plan": t_plan}
+
+
+class UiProbe:
+    """Instancia real de la app (ventana oculta) con las pestañas de capítulos y plan
+    construidas; cada medida incluye update_idletasks() para contar el trabajo de Tk."""
+
+    def __init__(self):
+        self.app = kmo.KindleMangaOptimizer()
+        self.app.root.withdraw()
+        for tab in (1, 2):      # "Vista Previa / Capítulos" y "Plan de salida"
+            self.app.notebook.select(tab)
+            self.app._build_selected_tab()
+        self.app.root.update_idletasks()
+
+    def _settle(self, fn, *args):
+        fn(*args)
+        self.app.root.update_idletasks()
+
+    def measure(self, chapters: list[kmo.Chapter], group_size: int) -> dict[str, float]:
+        app = self.app
+        app.group_size.set(group_size)
+        app.chapters = []
+        app.refresh_chapter_list()
+        app.update_plan_view()
+        app.chapters = chapters
+        t_list, _ = _timed(self._settle, app.refresh_chapter_list)
+        t_tree, _ = _timed(self._settle, app.update_plan_view)
+        # "subir" el capítulo central: toca dos filas y uno o dos volúmenes
+        i = len(chapters) // 2
+        app.chapter_list.selection_clear(0, kmo.tk.END)
+        app.chapter_list.selection_set(i)
+        t_move, _ = _timed(self._settle, app.move_chapter, -1)
+        return {"lista": t_list, "arbol": t_tree, "mover": t_move}
+
+    def close(self):
+        self.app.root.destroy()
+
+
+# -------------------------- Informe --------------------------
+STAGE_UNITS = {"escaneo": "archivos", "orden_caps": "capitulos", "orden_imgs": "archivos",
+               "plan": "capitulos", "lista": "capitulos", "arbol": "capitulos", "mover": "capitulos"}
+
+
+def scaling(rows: list[dict]) -> dict[str, dict[str, float]]:
+    """Por etapa: µs por unidad en la escala mayor y exponente k entre la menor y la mayor."""
+    out = {}
+    if not rows:
+        return out
+    lo, hi = rows[0], rows[-1]
+    for stage, unit in STAGE_UNITS.items():
+        if stage not in hi:
+            continue
+        entry = {"us_por_unidad": hi[stage] * 1e6 / max(1, hi[unit])}
+        if hi[unit] > lo[unit] and lo[stage] > 0 and hi[stage] > 0:
+            entry["exponente"] = math.log(hi[stage] / lo[stage]) / math.log(hi[unit] / lo[unit])
+        out[stage] = entry
+    return out
+
+
+def print_report(rows: list[dict], summary: dict[str, dict[str, float]]):
+    stages = [s for s in STAGE_UNITS if rows and s in rows[-1]]
+    print(f"{'capítulos':>10} {'archivos':>9} " + " ".join(f"{s:>11}" for s in stages) + "   (ms)")
+    for row in rows:
+        print(f"{row['capitulos']:>10} {row['archivos']:>9} "
+              + " ".join(f"{row[s] * 1000:>11.1f}" for s in stages))
+    print(f"{'µs/unidad':>20} " + " ".join(f"{summary[s]['us_por_unidad']:>11.2f}" for s in stages))
+    print(f"{'k (t ~ n^k)':>20} " + " ".join(
+        f"{summary[s]['exponente']:>11.2f}" if "exponente" in summary[s] else f"{'—':>11}" for s in stages))
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Banco de pruebas de bibliotecas grandes")
+    parser.add_argument("--profile", choices=list(kmo.PROFILES.keys()), default="TMO")
+    parser.add_argument("--scales", default=",".join(map(str, DEFAULT_SCALES)),
+                        help="número de capítulos de cada biblioteca, separados por comas")
+    parser.add_argument("--pages", type=int, default=DEFAULT_PAGES, help="imágenes por capítulo")
+    parser.add_argument("--group-size", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=3, help="repeticiones (se toma la mejor)")
+    parser.add_argument("--root", default="", help="dónde generar los árboles (por defecto, temporal; "
+                                                   "si se indica, se reutilizan entre ejecuciones)")
+    parser.add_argument("--no-ui", action="store_true", help="no medir la lista ni el árbol de Tk")
+    parser.add_argument("--json", default="", metavar="ARCHIVO", help="guardar también el informe en JSON")
+    args = parser.parse_args(argv)
+
+    scales = sorted({int(s) for s in args.scales.split(",") if s.strip()})
+    profile = kmo.PROFILES[args.profile]
+    base = Path(args.root) if args.root else Path(tempfile.mkdtemp(prefix="kmo_stress_"))
+    ui = None
+    if not args.no_ui:
+        try:
+            ui = UiProbe()
+        except kmo.tk.TclError as e:
+            print(f"Sin display ({e}); se omiten las medidas de la interfaz.")
+
+    rows = []
+    try:
+        for n in scales:
+            root = base / f"{profile.key}_{n}x{args.pages}"
+            t0 = time.perf_counter()
+            files = generate_library(root, profile.key, n, args.pages)
+            print(f"{root.name}: {files} archivos listos en {time.perf_counter() - t0:.1f} s", flush=True)
+            row = {"capitulos": n, "archivos": files}
+            row.update(measure_core(root, profile, args.group_size, args.repeat))
+            if ui is not None:
+                row.update(ui.measure(kmo.scan_chapters(root, profile), args.group_size))
+            rows.append(row)
+    finally:
+        if ui is not None:
+            ui.close()
+        if not args.root:
+            shutil.rmtree(base, ignore_errors=True)
+
+    summary = scaling(rows)
+    print_report(rows, summary)
+    if args.json:
+        Path(args.json).write_text(json.dumps({"profile": profile.key, "pages": args.pages, "rows": rows,
+                                               "scaling": summary}, indent=1), encoding="utf-8")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
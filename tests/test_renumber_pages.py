@@ -0,0 +1,29 @@
+from pathlib import Path
+
+import main as kmo
+
+
+def _touch(folder: Path, names: list[str]) -> list[Path]:
+    paths = []
+    for name in names:
+        p = folder / f"{name}.jpg"
+        p.write_bytes(name.encode())    # contenido = nombre original, para seguir cada página
+        paths.append(p)
+    return paths
+
+
+def test_drop_and_split_pages_keep_every_output(tmp_path):
+    # 00001 omitida (blank_pages="drop") y 00005 página doble dividida en dos
+    outputs = _touch(tmp_path, ["00002", "00003", "00004", "00005_001", "00005_002", "00006"])
+    final = kmo.renumber_pages(outputs)
+    assert [p.name for p in final] == [f"{n:05d}.jpg" for n in range(1, 7)]
+    assert [p.read_bytes().decode() for p in final] == ["00002", "00003", "00004",
+                                                         "00005_001", "00005_002", "00006"]
+    assert sorted(p.name for p in tmp_path.iterdir()) == [p.name for p in final]
+
+
+def test_split_pages_shift_following_numbers(tmp_path):
+    outputs = _touch(tmp_path, ["00001_001", "00001_002", "00002", "00003"])
+    final = kmo.renumber_pages(outputs)
+    assert [p.read_bytes().decode() for p in final] == ["00001_001", "00001_002", "00002", "00003"]
+    assert len(list(tmp_path.iterdir())) == 4